@@ -1,10 +1,40 @@
 import cv2
 import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
-import pygame
+from frame_buffer import create_frame_buffer
+from segment_recorder import SegmentRecorder, export_clip
+
+_sounds = {}
+_sound_lock = threading.Lock()
+
+
+def play_sound(path):
+    # المشغل يُهيأ مرة واحدة لكل العملية، والفشل يُحفظ حتى لا يُعاد في كل تنبيه
+    with _sound_lock:
+        if path not in _sounds:
+            try:
+                import pygame
+                if not pygame.mixer.get_init():
+                    pygame.mixer.init()
+                _sounds[path] = pygame.mixer.Sound(path)
+            except Exception:
+                _sounds[path] = None
+        sound = _sounds[path]
+    if sound is not None:
+        try:
+            sound.play()
+        except Exception:
+            pass
+
 
 class AlertSystem:
-    def __init__(self, output_dir="alerts"):
+    def __init__(self, output_dir="alerts", buffer_mode='raw', buffer_size=150, memory_budget_mb=None,
+                 buffer_options=None, post_roll_frames=60, writer_threads=2, writer_queue_size=16,
+                 metrics=None, event_store=None, camera='', recording=None,
+                 sound="alert.wav"):
         self.output_dir = output_dir
         self.images_dir = os.path.join(output_dir, "images")
         self.videos_dir = os.path.join(output_dir, "videos")
@@ -12,16 +42,39 @@ class AlertSystem:
         os.makedirs(self.images_dir, exist_ok=True)
         os.makedirs(self.videos_dir, exist_ok=True)
         
-        pygame.mixer.init()
-        self.alert_sound = None
-        try:
-            self.alert_sound = pygame.mixer.Sound("alert.wav")
-        except:
-            pass
+        # الصوت اختياري (sound=None لتعطيله)، ويُهيأ pygame عند أول تنبيه في خيط منفصل
+        # حتى لا يتأخر الإقلاع أو يتوقف على خادم بلا بطاقة صوت
+        self.sound = sound
         
-        self.video_buffer = []
-        self.buffer_size = 150
-        self.alert_count = 0
+        # ذاكرة ما قبل الحدث: حلقة مخصصة مسبقاً، أو إطارات مضغوطة/مصغرة تُفك عند كتابة المقطع
+        self.buffer_size = buffer_size
+        self.video_buffer = create_frame_buffer(buffer_mode, buffer_size, memory_budget_mb,
+                                                **(buffer_options or {}))
+        # كل تنبيه يُسجل في مخزن الأحداث مع صورة مصغرة، والعداد يُستعاد منه عند إعادة التشغيل
+        self.event_store = event_store
+        self.camera = camera
+        self.alert_count = event_store.count(camera=camera) if event_store is not None else 0
+        
+        # الكتابة على القرص تتم في خيوط خلفية، والمقطع يستمر post_roll_frames إطاراً بعد الحدث
+        self.post_roll_frames = post_roll_frames
+        self.dropped_alerts = 0
+        self.metrics = metrics
+        self.writer_threads = writer_threads
+        self._writer = ThreadPoolExecutor(max_workers=writer_threads, thread_name_prefix="alert-writer")
+        # طابور كتابة محدود بـ writer_queue_size مقطعاً (قيد الكتابة أو بانتظارها)، والمقطع الزائد يُرفض فوراً
+        self._writer_slots = threading.BoundedSemaphore(writer_queue_size)
+        self._pending_clips = []
+        self._lock = threading.Lock()
+        
+        # وضع التسجيل المستمر: الكاميرا تُسجل في مقاطع متتالية، والتنبيه يصبح مرجعاً إليها
+        # (قائمة مقاطع + نقطتا بداية ونهاية) أو دمجاً بنسخ التدفق، دون إعادة ترميز الإطارات
+        # المسجل يُنشأ في open_recorder() بعد فتح المصدر ومعرفة معدل إطاراته الحقيقي
+        self.recording = None if recording is None else dict(recording)
+        self.recorder = None
+        self.clip_mode = 'reference'
+        if self.recording is not None:
+            self.clip_mode = self.recording.pop('clip_mode', 'reference')
+            self.recording.setdefault('directory', os.path.join(output_dir, "segments", camera or "default"))
         
         self.severity_colors = {
             'critical': (0, 0, 255),
@@ -36,31 +89,147 @@ class AlertSystem:
             'crowd': 'تجمع مشبوه'
         }
     
+    def open_recorder(self, fps=None):
+        if self.recording is None or self.recorder is not None:
+            return self.recorder
+        options = dict(self.recording)
+        if fps and fps > 0:
+            options['fps'] = fps
+        self.recorder = SegmentRecorder(**options)
+        self.recorder.on_segment_closed.append(self._on_segment_closed)
+        return self.recorder
+    
     def trigger_alert(self, behavior, frame):
         self.alert_count += 1
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
-        behavior_type = behavior['type']
         
         self._play_sound()
-        image_path = self._save_image(frame, behavior, timestamp)
-        video_path = self._save_video(behavior, timestamp)
         
+        clip = {
+            'behavior': behavior,
+            'timestamp': timestamp,
+            'time': time.time(),
+            'frame': frame.copy(),
+            # مرجع إلى ما قبل الحدث في المخزن، والنسخ يتم عند الكتابة أو قبل أن يُكتب فوق الإطار
+            'pin': self.video_buffer.pin(self.buffer_size) if self.recording is None else None,
+            'remaining': self.post_roll_frames,
+            'future': Future()
+        }
+        if self.recording is not None:
+            # يُكتب التنبيه عند إغلاق المقطع الذي يحتوي نهاية ما بعد الحدث
+            written = self.open_recorder().frames
+            clip['in_frame'] = max(0, written - self.buffer_size)
+            clip['out_frame'] = written + self.post_roll_frames
+        if clip['remaining'] > 0 or self.recording is not None:
+            with self._lock:
+                self._pending_clips.append(clip)
+        else:
+            self.video_buffer.seal(clip['pin'])
+            self._submit([clip])
+        
+        return clip['future']
+    
+    def flush(self):
+        if self.recorder is not None:
+            # خارج القفل: إغلاق المقطع يستدعي _on_segment_closed من خيط التسجيل
+            self.recorder.flush()
+        with self._lock:
+            ready, self._pending_clips = self._pending_clips, []
+        for clip in ready:
+            if clip['pin'] is not None:
+                self.video_buffer.seal(clip['pin'])
+        self._submit(ready)
+    
+    def close(self):
+        # ينتظر كتابة كل المقاطع، ويبقى النظام صالحاً لتشغيل جديد: خيوط الكتابة والمسجل تُنشأ من جديد
+        self.flush()
+        self._writer.shutdown(wait=True)
+        self._writer = ThreadPoolExecutor(max_workers=self.writer_threads, thread_name_prefix="alert-writer")
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+    
+    def _submit(self, clips):
+        # تُستدعى خارج القفل حتى لا يتوقف add_frame_to_buffer أو خيط التسجيل على الإرسال.
+        # المقاطع التي تكتمل معاً (نفس الإطار أو نفس المقطع المسجل) تشغل مكاناً واحداً في طابور الكتابة
+        if not clips:
+            return
+        if not self._writer_slots.acquire(blocking=False):
+            self.dropped_alerts += len(clips)
+            for clip in clips:
+                self._release(clip)
+                self._record(clip, None, None)
+                clip['future'].set_result(self._result(clip, None, None))
+            return
+        
+        def write():
+            try:
+                for clip in clips:
+                    self._write_clip(clip)
+            finally:
+                self._writer_slots.release()
+        
+        self._writer.submit(write)
+    
+    def _write_clip(self, clip):
+        try:
+            start = time.perf_counter()
+            image_path = self._save_image(clip['frame'], clip['behavior'], clip['timestamp'])
+            if self.recording is not None:
+                video_path = self._export_clip(clip)
+            else:
+                video_path = self._save_video(clip['pin'], clip['behavior'], clip['timestamp'])
+            self._release(clip)
+            self._record(clip, image_path, video_path)
+            if self.metrics is not None:
+                self.metrics.observe('alert_write', time.perf_counter() - start)
+            clip['future'].set_result(self._result(clip, image_path, video_path))
+        except Exception as e:
+            self._release(clip)
+            clip['future'].set_exception(e)
+    
+    def _release(self, clip):
+        if clip['pin'] is not None:
+            self.video_buffer.release(clip['pin'])
+            clip['pin'] = None
+    
+    def _on_segment_closed(self, segment):
+        with self._lock:
+            ready = [clip for clip in self._pending_clips if clip['out_frame'] <= segment.end_frame]
+            self._pending_clips = [clip for clip in self._pending_clips if clip['out_frame'] > segment.end_frame]
+        self._submit(ready)
+    
+    def _export_clip(self, clip):
+        segments = self.recorder.segments(clip['in_frame'], clip['out_frame'])
+        name = f"{clip['behavior']['type']}_{clip['timestamp']}"
+        return export_clip(segments, clip['in_frame'], clip['out_frame'], self.recorder.fps, self.videos_dir, name,
+                           self.clip_mode)
+    
+    def _record(self, clip, image_path, video_path):
+        # الصورة المصغرة تُؤخذ من إطار التنبيه بعد رسم التعليقات عليه
+        if self.event_store is not None:
+            self.event_store.add(self.camera, clip['behavior'], clip['time'], frame=clip['frame'],
+                                 image=image_path, video=video_path)
+    
+    def _result(self, clip, image_path, video_path):
         return {
             'image': image_path,
             'video': video_path,
-            'behavior': behavior,
-            'timestamp': timestamp
+            'behavior': clip['behavior'],
+            'timestamp': clip['timestamp']
         }
     
     def _play_sound(self):
-        if self.alert_sound:
-            try:
-                self.alert_sound.play()
-            except:
-                pass
+        if not self.sound:
+            return
+        if self.sound in _sounds:
+            play_sound(self.sound)
+        else:
+            threading.Thread(target=play_sound, args=(self.sound,), name="alert-sound", daemon=True).start()
     
     def _save_image(self, frame, behavior, timestamp):
-        annotated_frame = frame.copy()
+        # الإطار نسخة خاصة بالتنبيه، لذا نرسم عليه مباشرة
+        annotated_frame = frame
         
         behavior_type = behavior['type']
         severity = behavior.get('severity', 'medium')
@@ -92,28 +261,49 @@ class AlertSystem:
         
         return filepath
     
-    def _save_video(self, behavior, timestamp):
-        if len(self.video_buffer) < 30:
+    def _save_video(self, pin, behavior, timestamp):
+        if len(pin) < 30:
+            return None
+        frames = self.video_buffer.read(pin)
+        first = next(frames, None)
+        if first is None:
             return None
         
         behavior_type = behavior['type']
         filename = f"{behavior_type}_{timestamp}.mp4"
         filepath = os.path.join(self.videos_dir, filename)
         
-        frame_height, frame_width = self.video_buffer[0].shape[:2]
+        frame_height, frame_width = first.shape[:2]
         fourcc = cv2.VideoWriter_fourcc(*'mp4v')
         out = cv2.VideoWriter(filepath, fourcc, 30, (frame_width, frame_height))
         
-        for frame in self.video_buffer[-150:]:
+        out.write(first)
+        for frame in frames:
             out.write(frame)
         
         out.release()
         return filepath
     
-    def add_frame_to_buffer(self, frame):
-        self.video_buffer.append(frame.copy())
-        if len(self.video_buffer) > self.buffer_size:
-            self.video_buffer.pop(0)
+    def add_frame_to_buffer(self, frame, timestamp=None):
+        # timestamp: زمن الإطار في المصدر، يحدد موضعه في التسجيل المستمر
+        if self.recording is not None:
+            self.open_recorder().write(frame, timestamp)
+            return
+        self.video_buffer.append(frame)
+        
+        if not self._pending_clips:
+            return
+        with self._lock:
+            still_pending, ready = [], []
+            for clip in self._pending_clips:
+                clip['remaining'] -= 1
+                if clip['remaining'] > 0:
+                    still_pending.append(clip)
+                else:
+                    self.video_buffer.seal(clip['pin'])
+                    ready.append(clip)
+            self._pending_clips = still_pending
+        self._submit(ready)
     
     def get_alert_count(self):
         return self.alert_count
@@ -0,0 +1,192 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+
+from zones import load_zones
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.m4v', '.wmv', '.mpg', '.mpeg', '.ts')
+
+_system = None
+
+
+def collect_videos(paths):
+    videos = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                videos.extend(os.path.join(root, name) for name in sorted(files)
+                              if name.lower().endswith(VIDEO_EXTENSIONS))
+        else:
+            videos.append(path)
+    return sorted(set(videos), key=videos.index)
+
+
+def job_names(videos):
+    # اسم فريد لكل ملف يُستخدم لسجل التنبيهات ومجلد الوسائط
+    names, seen = [], {}
+    for path in videos:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        seen[stem] = seen.get(stem, 0) + 1
+        names.append(stem if seen[stem] == 1 else f"{stem}_{seen[stem]}")
+    return names
+
+
+def init_worker(options, threads):
+    # نموذج واحد لكل عملية، ويُحدّ عدد الخيوط حتى لا تتزاحم العمليات على الأنوية
+    global _system
+    os.environ.setdefault('OMP_NUM_THREADS', str(threads))
+    cv2.setNumThreads(threads)
+    from moraqab_system import MoraqabSystem
+    _system = MoraqabSystem(**options)
+
+
+def process_video(path, name, output_dir):
+    from pipeline import Pipeline
+
+    stream = _system.create_stream(path, name)
+    log_path = os.path.join(output_dir, f"{name}.jsonl")
+    result = {'file': path, 'name': name, 'log': log_path, 'frames': 0, 'alerts': 0,
+              'behavior_counts': {}, 'elapsed': 0.0, 'fps': 0.0, 'error': None}
+
+    start = time.perf_counter()
+    with open(log_path, 'w', encoding='utf-8') as log:
+        def on_result(packet):
+            video_time = packet['index'] / stream.fps if stream.fps > 0 else None
+            for behavior in packet['behaviors']:
+                record = {
+                    'file': path,
+                    'frame': packet['index'],
+                    'time': video_time,
+                    'type': behavior['type'],
+                    'severity': behavior.get('severity'),
+                    'location': [int(v) for v in behavior.get('location', (0, 0))],
+                    'details': behavior.get('details', ''),
+                    'zone': behavior.get('zone'),
+                    'track_ids': behavior.get('track_ids', [])
+                }
+                log.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+        # المعالجة بأقصى سرعة: لا رسم للإطارات، والملفات لا تُسقط أي إطار
+        pipeline = Pipeline(_system, [stream], on_result=on_result, annotate=False)
+        try:
+            pipeline.start()
+        except IOError as e:
+            result['error'] = str(e)
+            return result
+        pipeline.wait()
+        if _system.event_store is not None:
+            _system.event_store.flush()
+
+    elapsed = time.perf_counter() - start
+    result.update(frames=stream.stats['frames'], alerts=stream.stats['alerts'],
+                  skipped=stream.stats['skipped'], behavior_counts=dict(stream.stats['behavior_counts']),
+                  elapsed=elapsed,
+                  fps=stream.stats['frames'] / elapsed if elapsed > 0 else 0.0,
+                  dropped_alerts=stream.alert_system.dropped_alerts)
+    return result
+
+
+def summarize(results, elapsed):
+    counts = {}
+    for result in results:
+        for behavior_type, count in result['behavior_counts'].items():
+            counts[behavior_type] = counts.get(behavior_type, 0) + count
+    frames = sum(result['frames'] for result in results)
+    return {
+        'files': len(results),
+        'failed': sum(1 for result in results if result['error']),
+        'frames': frames,
+        'alerts': sum(result['alerts'] for result in results),
+        'behavior_counts': counts,
+        'elapsed': elapsed,
+        'fps': frames / elapsed if elapsed > 0 else 0.0,
+        'results': results
+    }
+
+
+def run_batch(videos, output_dir, workers=None, threads=1, **options):
+    os.makedirs(output_dir, exist_ok=True)
+    options.setdefault('alert_options', {})
+    options['alert_options'] = dict(options['alert_options'], output_dir=os.path.join(output_dir, 'alerts'))
+    workers = workers or max(1, min(len(videos), os.cpu_count() // max(1, threads)))
+
+    start = time.perf_counter()
+    results = []
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=init_worker,
+                             initargs=(options, threads)) as pool:
+        futures = {pool.submit(process_video, path, name, output_dir): path
+                   for path, name in zip(videos, job_names(videos))}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {'file': futures[future], 'name': None, 'log': None, 'frames': 0, 'alerts': 0,
+                          'behavior_counts': {}, 'elapsed': 0.0, 'fps': 0.0, 'error': repr(e)}
+            results.append(result)
+            status = f"خطأ: {result['error']}" if result['error'] else \
+                f"{result['frames']} إطار، {result['alerts']} تنبيه، {result['fps']:.1f} fps"
+            print(f"[{len(results)}/{len(videos)}] {result['file']}: {status}")
+
+    results.sort(key=lambda result: videos.index(result['file']))
+    summary = summarize(results, time.perf_counter() - start)
+    with open(os.path.join(output_dir, 'summary.json'), 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="معالجة دفعية لملفات الفيديو المسجلة بدون واجهة")
+    parser.add_argument('paths', nargs='+', help="ملفات فيديو أو مجلدات")
+    parser.add_argument('--output', default='batch_output')
+    parser.add_argument('--workers', type=int, help="عدد العمليات (افتراضياً حسب عدد الأنوية)")
+    parser.add_argument('--threads', type=int, default=1, help="عدد الخيوط لكل عملية")
+    parser.add_argument('--backend', default='torch', choices=['torch', 'onnxruntime', 'openvino'])
+    parser.add_argument('--int8', action='store_true', help="نموذج مكمم INT8 (لخلفيات ONNX)")
+    parser.add_argument('--calibration', help="صور أو فيديو المعايرة للتكميم")
+    parser.add_argument('--tracker', default='centroid', choices=['centroid', 'kalman'])
+    parser.add_argument('--detection-interval', type=int, default=1)
+    parser.add_argument('--adaptive', action='store_true')
+    parser.add_argument('--motion-gate', action='store_true', help="تخطي الإطارات الساكنة")
+    parser.add_argument('--zones', help="ملف JSON للمناطق، مفاتيحه أسماء الملفات أو '*' للجميع")
+    parser.add_argument('--buffer-mode', default='raw', choices=['raw', 'jpeg', 'downscale'])
+    parser.add_argument('--sample-fps', type=float, help="مسح سريع: عدد الإطارات المفكوكة في كل ثانية من الفيديو")
+    parser.add_argument('--max-size', type=int, help="تصغير الإطار عند الفك إلى هذا الطول الأقصى")
+    args = parser.parse_args(argv)
+
+    videos = collect_videos(args.paths)
+    if not videos:
+        print("لم يتم العثور على ملفات فيديو")
+        return 1
+
+    backend_options = {'threads': args.threads, 'int8': args.int8, 'calibration': args.calibration}
+    if args.backend != 'torch':
+        # التصدير والتكميم مرة واحدة هنا، قبل أن تحمّل العمليات النموذج الجاهز
+        from inference_backend import export_onnx, quantize_int8
+        onnx_path = export_onnx()
+        if args.int8:
+            quantize_int8(onnx_path, args.calibration or videos[0])
+
+    print(f"معالجة {len(videos)} ملف...")
+    summary = run_batch(videos, args.output, args.workers, args.threads, tracker_type=args.tracker,
+                        detection_interval=args.detection_interval, adaptive_detection=args.adaptive,
+                        motion_gate=args.motion_gate, alert_options={'buffer_mode': args.buffer_mode},
+                        backend=args.backend, backend_options=backend_options,
+                        zones=load_zones(args.zones) if args.zones else None,
+                        decode_options={'sample_fps': args.sample_fps, 'max_size': args.max_size})
+
+    print(f"\nالملفات: {summary['files']} (فشل {summary['failed']})")
+    print(f"الإطارات: {summary['frames']} بسرعة {summary['fps']:.1f} fps")
+    print(f"التنبيهات: {summary['alerts']} {summary['behavior_counts']}")
+    print(f"الملخص: {os.path.join(args.output, 'summary.json')}")
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
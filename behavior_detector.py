@@ -1,65 +1,198 @@
+from types import SimpleNamespace
+
 import cv2
 import numpy as np
-from collections import defaultdict
+from scipy.spatial import cKDTree
+from fire_detector import FireDetector
+from track_state import TrackStateStore
+from zones import THRESHOLDS, ZoneLayout
+
+TRACK_FEATURES = ('velocities', 'speeds', 'path_speeds', 'prev_speeds', 'accelerations', 'aspects',
+                  'aspect_changes')
+
+
+def box_size(bbox):
+    if bbox is None:
+        return (0, 0)
+    x1, y1, x2, y2 = bbox
+    return (x2 - x1, y2 - y1)
+
 
 class BehaviorDetector:
-    def __init__(self):
-        self.person_history = defaultdict(list)
-        self.last_positions = {}
-        self.speeds = {}
+    THRESHOLDS = THRESHOLDS
+
+    def __init__(self, fire_mode='full', fire_options=None, history_size=30, max_idle_frames=300, zones=None,
+                 velocity_span=3, fps=30):
+        # تاريخ كل مسار (المركز والصندوق والزمن) يُحذف عند انتهاء المسار في المتتبع
+        self.tracks = TrackStateStore(history_size)
+        self.velocity_span = velocity_span
+        # بدون طابع زمني من المصدر يُفترض معدل إطارات ثابت
+        self.fps = fps
+        self.max_idle_frames = max_idle_frames
         self.frame_count = 0
         self.alert_cooldown = {}
         self.cooldown_frames = 30
         self.vehicle_classes = [2, 3, 5, 7]
 
-    def detect_behaviors(self, tracked_objects, frame):
+        # السرعات بالبكسل/ثانية (العتبات السابقة بالبكسل/إطار × 30)
+        self.fight_distance = 80
+        self.fight_speed = 600
+        self.vehicle_distance = 160
+        self.fall_speed_before = 2400
+        self.fall_speed_after = 600
+        # السقوط يتطلب أيضاً أن تنخفض نسبة ارتفاع الصندوق إلى عرضه إلى هذا الجزء من قيمتها (None لتعطيله)
+        self.fall_aspect_change = 0.75
+        self.crowd_radius = 150
+        self.crowd_min_persons = 6
+        self.crowd_min_neighbors = 4
+
+        if fire_mode not in ('full', 'fast'):
+            raise ValueError(f"Unknown fire mode: {fire_mode}")
+        # الوضع السريع: صورة مصغرة، تحديث تدريجي للمناطق المتغيرة وتراكم الأدلة عبر الزمن
+        self.fire_detector = FireDetector(**(fire_options or {})) if fire_mode == 'fast' else None
+
+        # مناطق مضلعة: كل منطقة تفعّل قواعدها وعتباتها الخاصة، وما خارج المناطق لا يُنبّه
+        self.zones = zones if zones is None or isinstance(zones, ZoneLayout) else ZoneLayout(zones)
+
+    def detect_behaviors(self, tracked_objects, frame, timestamp=None):
         behaviors = []
         self.frame_count += 1
+        if timestamp is None:
+            timestamp = self.frame_count / self.fps
+
+        self.tracks.record([obj['id'] for obj in tracked_objects], [obj['center'] for obj in tracked_objects],
+                           self.frame_count, [box_size(obj.get('bbox')) for obj in tracked_objects], timestamp)
 
         persons = [obj for obj in tracked_objects if obj['class'] == 0]
         vehicles = [obj for obj in tracked_objects if obj['class'] in self.vehicle_classes]
+        index = self._build_index(persons, vehicles)
 
-        behaviors.extend(self._detect_fighting(persons))
-        behaviors.extend(self._detect_fire(frame))
-        behaviors.extend(self._detect_fall(persons, vehicles))
-        behaviors.extend(self._detect_crowd(persons))
+        if self.zones is None:
+            behaviors.extend(self._detect_fighting(index, self))
+            if frame is not None:
+                behaviors.extend(self._detect_fire(frame))
+            behaviors.extend(self._detect_fall(index, self))
+            behaviors.extend(self._detect_crowd(index, self))
+        else:
+            behaviors.extend(self._detect_in_zones(index, frame))
 
-        for obj in tracked_objects:
-            self.last_positions[obj['id']] = obj['center']
+        if self.frame_count % self.cooldown_frames == 0:
+            self._expire_state()
 
         return self._filter_cooldown(behaviors)
 
-    def _detect_fighting(self, persons):
+    def _detect_in_zones(self, index, frame):
         behaviors = []
+        person_zones = self.zones.locate(index['centers'])
+        fire = self._detect_fire(frame) if frame is not None and any(
+            'fire' in zone.rules for zone in self.zones.zones) else []
+
+        for i, zone in enumerate(self.zones.zones):
+            params = self._zone_params(zone)
+            zone_index = self._subset_index(index, person_zones == i)
+            found = []
+            if 'fighting' in zone.rules:
+                found.extend(self._detect_fighting(zone_index, params))
+            if 'fire' in zone.rules:
+                found.extend(b for b in fire if zone.contains([b['location']])[0])
+            if 'fall' in zone.rules:
+                found.extend(self._detect_fall(zone_index, params))
+            if 'crowd' in zone.rules:
+                found.extend(self._detect_crowd(zone_index, params))
+            behaviors.extend(dict(behavior, zone=zone.name) for behavior in found)
 
-        for i, p1 in enumerate(persons):
-            x1, y1 = p1['center']
-            pid1 = p1['id']
-
-            for p2 in persons[i+1:]:
-                x2, y2 = p2['center']
-                pid2 = p2['id']
-                distance = np.sqrt((x1 - x2)**2 + (y1 - y2)**2)
-
-                if distance < 100:
-                    if pid1 in self.last_positions and pid2 in self.last_positions:
-                        prev_x1, prev_y1 = self.last_positions[pid1]
-                        prev_x2, prev_y2 = self.last_positions[pid2]
-                        speed1 = np.sqrt((x1 - prev_x1)**2 + (y1 - prev_y1)**2)
-                        speed2 = np.sqrt((x2 - prev_x2)**2 + (y2 - prev_y2)**2)
-
-                        if (speed1 > 20 or speed2 > 20) and distance < 80:
-                            behaviors.append({
-                                'type': 'fighting',
-                                'severity': 'critical',
-                                'location': ((x1 + x2)//2, (y1 + y2)//2),
-                                'details': f'{distance:.0f}px, {max(speed1, speed2):.0f}px/s',
-                                'key': f'fighting_{pid1}_{pid2}'
-                            })
+        return behaviors
+
+    def _zone_params(self, zone):
+        params = {name: getattr(self, name) for name in self.THRESHOLDS}
+        params.update(zone.thresholds)
+        return SimpleNamespace(**params)
+
+    @staticmethod
+    def _subset_index(index, mask):
+        # كل شخص ينتمي لمنطقة واحدة، أما المركبات فتبقى كلها لقاعدة الدهس
+        subset = {key: index[key][mask] for key in ('ids', 'slots', 'centers') + TRACK_FEATURES}
+        subset['tree'] = cKDTree(subset['centers'])
+        subset['pairs'] = {}
+        subset['vehicle_tree'] = index['vehicle_tree']
+        return subset
+
+    def remove_tracks(self, track_ids):
+        self.tracks.evict(track_ids)
+
+    def _expire_state(self):
+        # مفتاح أقدم من فترة التهدئة لا يمنع أي تنبيه، فيمكن حذفه بأمان
+        self.alert_cooldown = {key: frame for key, frame in self.alert_cooldown.items()
+                               if self.frame_count - frame <= self.cooldown_frames}
+        self.tracks.evict_idle(self.frame_count, self.max_idle_frames)
+
+    def _build_index(self, persons, vehicles):
+        # فهرس مكاني وخصائص حركية مشتركة لكل القواعد في هذا الإطار
+        ids = np.array([p['id'] for p in persons], dtype=np.int64)
+        centers = np.array([p['center'] for p in persons], dtype=np.float64).reshape(-1, 2)
+        slots = self.tracks.lookup(ids.tolist())
+
+        vehicle_centers = np.array([v['center'] for v in vehicles], dtype=np.float64).reshape(-1, 2)
+
+        index = {
+            'ids': ids,
+            'slots': slots,
+            'centers': centers,
+            'tree': cKDTree(centers),
+            'pairs': {},
+            'vehicle_tree': cKDTree(vehicle_centers) if len(vehicles) else None
+        }
+        index.update(self.tracks.features(slots, self.velocity_span))
+        return index
+
+    @staticmethod
+    def _pairs(index, params):
+        # أزواج الأشخاص المتجاورين ومسافاتها تُحسب مرة واحدة بأكبر نصف قطر، وكل قاعدة تأخذ ما يخصها
+        radius = np.nextafter(max(params.fight_distance, params.crowd_radius), 0)
+        pairs = index['pairs'].get(radius)
+        if pairs is None:
+            near = index['tree'].sparse_distance_matrix(index['tree'], radius, output_type='ndarray')
+            near = near[near['i'] < near['j']]
+            pairs = index['pairs'][radius] = near[np.lexsort((near['j'], near['i']))]
+        return pairs
+
+    def _detect_fighting(self, index, params):
+        behaviors = []
+        if len(index['ids']) < 2:
+            return behaviors
+
+        near = self._pairs(index, params)
+        near = near[near['v'] < params.fight_distance]
+        if len(near) == 0:
+            return behaviors
+
+        centers = index['centers']
+        pairs = np.stack([near['i'], near['j']], axis=1)
+        distances = near['v']
+        # حركة الشجار تتذبذب حول نفس المكان، فتُقاس بطول المسار لا بالإزاحة الصافية
+        pair_speeds = index['path_speeds'][pairs]
+        # NaN تعني أن أحد الشخصين ليس له تاريخ كافٍ
+        moving = ~np.isnan(pair_speeds).any(axis=1) & (pair_speeds > params.fight_speed).any(axis=1)
+
+        for (i, j), distance, (speed1, speed2) in zip(pairs[moving], distances[moving], pair_speeds[moving]):
+            x1, y1 = centers[i].astype(int).tolist()
+            x2, y2 = centers[j].astype(int).tolist()
+            pid1, pid2 = index['ids'][i], index['ids'][j]
+            behaviors.append({
+                'type': 'fighting',
+                'severity': 'critical',
+                'location': ((x1 + x2)//2, (y1 + y2)//2),
+                'details': f'{distance:.0f}px, {max(speed1, speed2):.0f}px/s',
+                'key': f'fighting_{pid1}_{pid2}',
+                'track_ids': [int(pid1), int(pid2)]
+            })
 
         return behaviors
 
     def _detect_fire(self, frame):
+        if self.fire_detector is not None:
+            return self.fire_detector.detect(frame)
+
         behaviors = []
         hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
 
@@ -102,70 +235,64 @@ class BehaviorDetector:
 
         return behaviors
 
-    def _detect_fall(self, persons, vehicles):
+    def _detect_fall(self, index, params):
         behaviors = []
+        ids = index['ids']
+        centers = index['centers']
+
+        if index['vehicle_tree'] is not None and len(ids):
+            near = index['tree'].sparse_distance_matrix(
+                index['vehicle_tree'], np.nextafter(params.vehicle_distance, 0), output_type='ndarray')
+            near = near[np.lexsort((near['j'], near['i']))]
+            for i, distance in zip(near['i'], near['v']):
+                px, py = centers[i].astype(int).tolist()
+                behaviors.append({
+                    'type': 'fall',
+                    'severity': 'critical',
+                    'location': (px, py),
+                    'details': f'{distance:.0f}px',
+                    'key': f'car_hit_{ids[i]}',
+                    'track_ids': [int(ids[i])]
+                })
 
-        for person in persons:
-            pid = person['id']
-            px, py = person['center']
-
-            for vehicle in vehicles:
-                vx, vy = vehicle['center']
-                distance = np.sqrt((px - vx)**2 + (py - vy)**2)
-
-                if distance < 160:
-                    behaviors.append({
-                        'type': 'fall',
-                        'severity': 'critical',
-                        'location': (px, py),
-                        'details': f'{distance:.0f}px',
-                        'key': f'car_hit_{pid}'
-                    })
-
-            if pid in self.last_positions:
-                prev_x, prev_y = self.last_positions[pid]
-                speed = np.sqrt((px - prev_x)**2 + (py - prev_y)**2)
-
-                if pid in self.speeds:
-                    prev_speed = self.speeds[pid]
-                    if prev_speed > 80 and speed < 20:
-                        behaviors.append({
-                            'type': 'fall',
-                            'severity': 'critical',
-                            'location': (px, py),
-                            'details': f'{prev_speed:.0f}->{speed:.0f}',
-                            'key': f'fall_{pid}'
-                        })
-
-                self.speeds[pid] = speed
+        # توقف مفاجئ بعد حركة سريعة، مع تحول الصندوق من واقف إلى ممدد
+        speeds = index['speeds']
+        prev_speeds = index['prev_speeds']
+        dropped = (prev_speeds > params.fall_speed_before) & (speeds < params.fall_speed_after)
+        if params.fall_aspect_change is not None:
+            dropped &= index['aspect_changes'] < params.fall_aspect_change
+        for i in np.flatnonzero(dropped):
+            px, py = centers[i].astype(int).tolist()
+            behaviors.append({
+                'type': 'fall',
+                'severity': 'critical',
+                'location': (px, py),
+                'details': f'{prev_speeds[i]:.0f}->{speeds[i]:.0f}px/s',
+                'key': f'fall_{ids[i]}',
+                'track_ids': [int(ids[i])]
+            })
 
         return behaviors
 
-    def _detect_crowd(self, persons):
+    def _detect_crowd(self, index, params):
         behaviors = []
-        if len(persons) >= 6:
-            positions = [p['center'] for p in persons]
-
-            for i, pos1 in enumerate(positions):
-                x1, y1 = pos1
-                nearby = 0
-
-                for j, pos2 in enumerate(positions):
-                    if i != j:
-                        x2, y2 = pos2
-                        distance = np.sqrt((x1 - x2)**2 + (y1 - y2)**2)
-                        if distance < 150:
-                            nearby += 1
-
-                if nearby >= 4:
-                    behaviors.append({
-                        'type': 'crowd',
-                        'severity': 'medium',
-                        'location': (x1, y1),
-                        'details': str(len(persons)),
-                        'key': 'crowd_detected'
-                    })
-                    break
+        persons_count = len(index['ids'])
+        if persons_count >= params.crowd_min_persons:
+            near = self._pairs(index, params)
+            near = near[near['v'] < params.crowd_radius]
+            nearby = np.bincount(np.concatenate([near['i'], near['j']]), minlength=persons_count)
+            crowded = np.flatnonzero(nearby >= params.crowd_min_neighbors)
+
+            if len(crowded):
+                x1, y1 = index['centers'][crowded[0]].astype(int).tolist()
+                behaviors.append({
+                    'type': 'crowd',
+                    'severity': 'medium',
+                    'location': (x1, y1),
+                    'details': str(persons_count),
+                    'key': 'crowd_detected',
+                    'track_ids': [int(index['ids'][i]) for i in crowded]
+                })
 
         return behaviors
 
@@ -0,0 +1,284 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from behavior_detector import BehaviorDetector
+from fire_detector import FireDetector
+from inference_backend import DetectionBox, DetectionResult
+from kalman_tracker import KalmanTracker
+from tracker import ObjectTracker
+
+
+class SyntheticScene:
+    PERSON_COLOR = (255, 0, 0)
+    VEHICLE_COLOR = (0, 255, 0)
+    FIRE_COLOR = (0, 90, 255)
+
+    def __init__(self, width=1280, height=720, persons=20, vehicles=4, fire_regions=0,
+                 motion='random', seed=0):
+        if motion not in ('static', 'linear', 'random', 'crowd'):
+            raise ValueError(f"Unknown motion pattern: {motion}")
+        self.width = width
+        self.height = height
+        self.motion = motion
+        self.rng = np.random.default_rng(seed)
+
+        count = persons + vehicles
+        self.classes = np.array([0] * persons + [2] * vehicles, dtype=np.int32)
+        self.sizes = np.where(self.classes[:, None] == 0, (30, 80), (120, 70)).astype(np.float64)
+        self.positions = self.rng.uniform((0, 0), (width, height), size=(count, 2))
+        self.velocities = self.rng.normal(0, 4, size=(count, 2)) if motion != 'static' else np.zeros((count, 2))
+
+        self.fire_centers = self.rng.uniform((0, 0), (width, height), size=(fire_regions, 2)).astype(int)
+        noise = self.rng.integers(90, 130, size=(height, width, 1), dtype=np.uint8)
+        self.background = np.repeat(noise, 3, axis=2)
+
+    def step(self):
+        if self.motion == 'random':
+            self.velocities += self.rng.normal(0, 1.5, size=self.velocities.shape)
+            # اندفاعات مفاجئة لتفعيل قواعد الشجار والسقوط
+            sprint = self.rng.random(len(self.velocities)) < 0.01
+            self.velocities[sprint] *= 8
+            self.velocities = np.clip(self.velocities, -60, 60)
+        elif self.motion == 'crowd':
+            center = np.array([self.width / 2, self.height / 2])
+            self.velocities = (center - self.positions) * 0.02 + self.rng.normal(0, 1, self.velocities.shape)
+
+        self.positions += self.velocities
+        limits = np.array([self.width, self.height])
+        bounced = (self.positions < 0) | (self.positions > limits)
+        self.velocities[bounced] *= -1
+        self.positions = np.clip(self.positions, 0, limits)
+
+        frame = self.background.copy()
+        boxes = np.concatenate([self.positions - self.sizes / 2, self.positions + self.sizes / 2], axis=1).astype(int)
+        detections = []
+        for box, obj_class in zip(boxes.tolist(), self.classes.tolist()):
+            color = self.PERSON_COLOR if obj_class == 0 else self.VEHICLE_COLOR
+            cv2.rectangle(frame, tuple(box[:2]), tuple(box[2:]), color, -1)
+            detections.append({'bbox': tuple(box), 'confidence': 0.9, 'class': obj_class})
+
+        for cx, cy in self.fire_centers.tolist():
+            radius = int(self.rng.integers(60, 90))
+            cv2.circle(frame, (cx, cy), radius, self.FIRE_COLOR, -1)
+
+        return frame, detections
+
+    def frames(self, count):
+        for _ in range(count):
+            yield self.step()
+
+    def write_video(self, path, count, fps=30):
+        out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), fps, (self.width, self.height))
+        for frame, _ in self.frames(count):
+            out.write(frame)
+        out.release()
+        return path
+
+
+class StubModel:
+    # كاشف بديل يعتمد على ألوان المشهد الاصطناعي، بنفس واجهة نموذج YOLO
+    def __init__(self, min_area=200, tolerance=60):
+        self.min_area = min_area
+        self.tolerance = tolerance
+        self.colors = {0: SyntheticScene.PERSON_COLOR, 2: SyntheticScene.VEHICLE_COLOR}
+
+    def __call__(self, source, verbose=False):
+        frames = source if isinstance(source, (list, tuple)) else [source]
+        return [self._detect(frame) for frame in frames]
+
+    def _detect(self, frame):
+        boxes = []
+        for obj_class, color in self.colors.items():
+            lower = np.clip(np.array(color) - self.tolerance, 0, 255)
+            upper = np.clip(np.array(color) + self.tolerance, 0, 255)
+            mask = cv2.inRange(frame, lower, upper)
+            count, _, stats, _ = cv2.connectedComponentsWithStats(mask)
+            for x, y, w, h, area in stats[1:count]:
+                if area >= self.min_area:
+                    boxes.append(DetectionBox((x, y, x + w, y + h), 0.9, obj_class))
+        return DetectionResult(boxes)
+
+
+def summarize(name, latencies, peak_bytes=None):
+    latencies = np.asarray(latencies) * 1000
+    total = latencies.sum() / 1000
+    return {
+        'stage': name,
+        'frames': len(latencies),
+        'fps': len(latencies) / total if total > 0 else float('inf'),
+        'p50_ms': float(np.percentile(latencies, 50)) if len(latencies) else 0.0,
+        'p99_ms': float(np.percentile(latencies, 99)) if len(latencies) else 0.0,
+        'peak_mb': None if peak_bytes is None else peak_bytes / (1024 * 1024)
+    }
+
+
+def time_stage(make_stage, inputs):
+    stage = make_stage()
+    latencies = []
+    for item in inputs:
+        start = time.perf_counter()
+        stage(item)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def peak_memory(make_stage, inputs):
+    tracemalloc.start()
+    try:
+        stage = make_stage()
+        for item in inputs:
+            stage(item)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def make_tracker_stage(tracker_cls):
+    def make():
+        tracker = tracker_cls()
+        return lambda item: tracker.update(item[1])
+    return make
+
+
+def make_behavior_stage(inputs, **options):
+    tracker = ObjectTracker()
+    tracked = [tracker.update(detections) for _, detections in inputs]
+
+    def make():
+        detector = BehaviorDetector(**options)
+        frames = iter(tracked)
+        return lambda item: detector.detect_behaviors(next(frames), item[0])
+    return make
+
+
+def make_fire_stage(mode):
+    def make():
+        if mode == 'fast':
+            detect = FireDetector().detect
+        else:
+            detect = BehaviorDetector()._detect_fire
+        return lambda item: detect(item[0])
+    return make
+
+
+def make_alert_stage(output_dir, alert_every, **options):
+    from alert_system import AlertSystem
+
+    def make():
+        alert_system = AlertSystem(output_dir, **options)
+        counter = {'frames': 0}
+        behavior = {'type': 'fire', 'severity': 'critical', 'location': (50, 50), 'details': 'benchmark'}
+
+        def stage(item):
+            alert_system.add_frame_to_buffer(item[0])
+            counter['frames'] += 1
+            if counter['frames'] % alert_every == 0:
+                alert_system.trigger_alert(behavior, item[0])
+        return stage
+    return make
+
+
+def make_detector_stage(system):
+    return lambda: (lambda item: system.detect(item[0]))
+
+
+def run_pipeline(system, video_path):
+    latencies = []
+
+    def on_result(result):
+        latencies.append(time.time() - result['timestamp'])
+
+    start = time.perf_counter()
+    pipeline = system.run(video_path, on_result=on_result)
+    elapsed = time.perf_counter() - start
+    frames = pipeline.stats['frames']
+    result = summarize('pipeline', latencies)
+    result['frames'] = frames
+    result['fps'] = frames / elapsed if elapsed > 0 else float('inf')
+    return result
+
+
+def run_benchmarks(args):
+    scene = SyntheticScene(args.width, args.height, args.persons, args.vehicles, args.fire,
+                           args.motion, args.seed)
+    inputs = list(scene.frames(args.frames))
+    output_dir = tempfile.mkdtemp(prefix='moraqab_bench_')
+    stages = set(args.stages.split(','))
+    results = []
+
+    def measure(name, make_stage):
+        latencies = time_stage(make_stage, inputs)
+        peak = peak_memory(make_stage, inputs) if args.memory else None
+        results.append(summarize(name, latencies, peak))
+        print(f"  {name}: {results[-1]['fps']:.1f} fps")
+
+    print("تشغيل اختبارات الأداء...")
+    if 'tracker' in stages:
+        measure('tracker.centroid', make_tracker_stage(ObjectTracker))
+        measure('tracker.kalman', make_tracker_stage(KalmanTracker))
+    if 'behavior' in stages:
+        measure('behavior.full_fire', make_behavior_stage(inputs))
+        measure('behavior.fast_fire', make_behavior_stage(inputs, fire_mode='fast'))
+    if 'fire' in stages:
+        measure('fire.full', make_fire_stage('full'))
+        measure('fire.fast', make_fire_stage('fast'))
+    if 'alert' in stages:
+        for mode in ('raw', 'jpeg'):
+            measure(f'alert.{mode}', make_alert_stage(os.path.join(output_dir, mode), args.alert_every,
+                                                      buffer_mode=mode))
+
+    if stages & {'detector', 'pipeline'}:
+        from moraqab_system import MoraqabSystem
+        system = MoraqabSystem(tracker_type=args.tracker, model=StubModel(),
+                               alert_options={'output_dir': os.path.join(output_dir, 'pipeline')})
+        if 'detector' in stages:
+            measure('detector.stub', make_detector_stage(system))
+        if 'pipeline' in stages:
+            video_path = scene.write_video(os.path.join(output_dir, 'scene.avi'), args.frames)
+            results.append(run_pipeline(system, video_path))
+            print(f"  pipeline: {results[-1]['fps']:.1f} fps")
+
+    return results
+
+
+def print_report(results):
+    print(f"\n{'stage':<22}{'frames':>8}{'fps':>12}{'p50 ms':>10}{'p99 ms':>10}{'peak MB':>10}")
+    for r in results:
+        peak = '-' if r['peak_mb'] is None else f"{r['peak_mb']:.1f}"
+        print(f"{r['stage']:<22}{r['frames']:>8}{r['fps']:>12.1f}{r['p50_ms']:>10.2f}{r['p99_ms']:>10.2f}{peak:>10}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="اختبارات أداء نظام مرقاب على مشاهد اصطناعية")
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--persons', type=int, default=20)
+    parser.add_argument('--vehicles', type=int, default=4)
+    parser.add_argument('--fire', type=int, default=1, help="عدد مناطق الحريق")
+    parser.add_argument('--motion', default='linear', choices=['static', 'linear', 'random', 'crowd'])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--tracker', default='centroid', choices=['centroid', 'kalman'])
+    parser.add_argument('--alert-every', type=int, default=100)
+    parser.add_argument('--stages', default='tracker,behavior,fire,alert,detector,pipeline')
+    parser.add_argument('--no-memory', dest='memory', action='store_false')
+    parser.add_argument('--json', help="حفظ النتائج في ملف JSON")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args)
+    print_report(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'config': vars(args), 'results': results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
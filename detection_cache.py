@@ -0,0 +1,103 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+
+import numpy as np
+
+
+def video_hash(path, chunk_size=1 << 20):
+    # بصمة سريعة من الحجم وثلاث قطع (البداية والوسط والنهاية) بدل قراءة الملف كاملاً
+    size = os.path.getsize(path)
+    digest = hashlib.sha1(str(size).encode())
+    with open(path, 'rb') as f:
+        for offset in (0, max(0, size // 2 - chunk_size // 2), max(0, size - chunk_size)):
+            f.seek(offset)
+            digest.update(f.read(chunk_size))
+    return digest.hexdigest()[:16]
+
+
+def model_name(model):
+    # الخلفية جزء من المفتاح: نفس الأوزان تعطي كشفاً مختلفاً قليلاً في torch و ONNX Runtime و OpenVINO
+    path = getattr(model, 'ckpt_path', None)
+    if path is None:
+        return type(model).__name__
+    name = os.path.splitext(os.path.basename(str(path)))[0]
+    return f"{name}_{getattr(model, 'backend', None) or 'torch'}"
+
+
+class DetectionCache:
+    COLUMNS = ('offsets', 'boxes', 'confidences', 'classes')
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+            self.meta = json.load(f)
+        # المصفوفات تُقرأ من القرص عند الحاجة فقط
+        for column in self.COLUMNS:
+            setattr(self, column, np.load(os.path.join(path, f"{column}.npy"), mmap_mode='r'))
+
+    @staticmethod
+    def path_for(cache_dir, video_path, model):
+        safe_model = re.sub(r'[^A-Za-z0-9_.-]', '_', model)
+        return os.path.join(cache_dir, f"{video_hash(video_path)}_{safe_model}")
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(os.path.join(path, 'meta.json'))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        start, end = self.offsets[index], self.offsets[index + 1]
+        if start == end:
+            return []
+        boxes = self.boxes[start:end].tolist()
+        confidences = self.confidences[start:end].tolist()
+        classes = self.classes[start:end].tolist()
+        return [{'bbox': tuple(box), 'confidence': conf, 'class': cls}
+                for box, conf, cls in zip(boxes, confidences, classes)]
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+
+class DetectionCacheWriter:
+    def __init__(self, path, meta=None):
+        self.path = path
+        self.meta = dict(meta or {})
+        self.offsets = [0]
+        self.boxes = []
+        self.confidences = []
+        self.classes = []
+
+    def append(self, detections):
+        for det in detections:
+            self.boxes.append(det['bbox'])
+            self.confidences.append(det['confidence'])
+            self.classes.append(det['class'])
+        self.offsets.append(len(self.boxes))
+
+    def close(self):
+        # الكتابة في مجلد مؤقت ثم إعادة تسميته حتى لا يبقى ملف ناقص عند الانقطاع
+        tmp_path = self.path + '.tmp'
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        columns = {
+            'offsets': np.asarray(self.offsets, dtype=np.int64),
+            'boxes': np.asarray(self.boxes, dtype=np.int32).reshape(-1, 4),
+            'confidences': np.asarray(self.confidences, dtype=np.float32),
+            'classes': np.asarray(self.classes, dtype=np.int16)
+        }
+        for column, values in columns.items():
+            np.save(os.path.join(tmp_path, f"{column}.npy"), values)
+        self.meta.update(frames=len(self.offsets) - 1, detections=len(self.boxes))
+        with open(os.path.join(tmp_path, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f, ensure_ascii=False, indent=2)
+
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.replace(tmp_path, self.path)
+        return DetectionCache(self.path)
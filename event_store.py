@@ -0,0 +1,253 @@
+import argparse
+import atexit
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+
+import cv2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    camera TEXT NOT NULL,
+    type TEXT NOT NULL,
+    severity TEXT,
+    ts REAL NOT NULL,
+    x INTEGER,
+    y INTEGER,
+    zone TEXT,
+    details TEXT,
+    image TEXT,
+    video TEXT,
+    thumbnail BLOB
+);
+CREATE TABLE IF NOT EXISTS event_tracks (
+    event_id INTEGER NOT NULL REFERENCES events(id),
+    track_id INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_events_ts ON events(ts);
+CREATE INDEX IF NOT EXISTS idx_events_type_ts ON events(type, ts);
+CREATE INDEX IF NOT EXISTS idx_events_camera_ts ON events(camera, ts);
+CREATE INDEX IF NOT EXISTS idx_event_tracks ON event_tracks(track_id, event_id);
+"""
+
+COLUMNS = ('id', 'camera', 'type', 'severity', 'ts', 'x', 'y', 'zone', 'details', 'image', 'video')
+
+
+def make_thumbnail(frame, size=(160, 90), quality=70):
+    small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+    ok, data = cv2.imencode('.jpg', small, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return data.tobytes() if ok else None
+
+
+class EventStore:
+    def __init__(self, path='alerts/events.db', batch_size=256, flush_interval=0.5, thumbnail_size=(160, 90),
+                 thumbnail_quality=70, retries=3, retry_delay=1.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.thumbnail_size = thumbnail_size
+        self.thumbnail_quality = thumbnail_quality
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.written = 0
+        self.failed = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+        # الإدخال من خيط كتابة واحد على دفعات، والقراءة بأي خيط بفضل وضع WAL
+        self._queue = queue.Queue()
+        self._reader = self._connect()
+        self._reader_lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._writer, name="event-store", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def add(self, camera, behavior, timestamp=None, frame=None, image=None, video=None):
+        thumbnail = None
+        if frame is not None:
+            thumbnail = make_thumbnail(frame, self.thumbnail_size, self.thumbnail_quality)
+        x, y = behavior.get('location', (None, None))
+        self._queue.put((
+            (camera, behavior['type'], behavior.get('severity'), timestamp or time.time(),
+             None if x is None else int(x), None if y is None else int(y), behavior.get('zone'),
+             behavior.get('details'), image, video, thumbnail),
+            [int(track_id) for track_id in behavior.get('track_ids', ())]
+        ))
+
+    def query(self, start=None, end=None, types=None, camera=None, severity=None, track_id=None, limit=100,
+              before=None, with_thumbnails=False):
+        # الصفحة التالية تبدأ بعد (ts, id) لآخر حدث بدل OFFSET حتى يبقى الاستعلام سريعاً مع ملايين الأحداث
+        columns = COLUMNS + (('thumbnail',) if with_thumbnails else ())
+        where, params = self._filters(start, end, types, camera, severity, track_id)
+        if before is not None:
+            where.append("(ts < ? OR (ts = ? AND id < ?))")
+            params.extend([before[0], before[0], before[1]])
+        sql = f"SELECT {', '.join(columns)} FROM events"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY ts DESC, id DESC LIMIT ?"
+        params.append(limit)
+
+        with self._reader_lock:
+            rows = self._reader.execute(sql, params).fetchall()
+            events = [dict(zip(columns, row)) for row in rows]
+            if events:
+                ids = [event['id'] for event in events]
+                tracks = self._reader.execute(
+                    f"SELECT event_id, track_id FROM event_tracks WHERE event_id IN ({','.join('?' * len(ids))})",
+                    ids).fetchall()
+        by_event = {}
+        for event_id, track in tracks if events else ():
+            by_event.setdefault(event_id, []).append(track)
+        for event in events:
+            event['track_ids'] = by_event.get(event['id'], [])
+        return events
+
+    def count(self, start=None, end=None, types=None, camera=None, severity=None, track_id=None):
+        where, params = self._filters(start, end, types, camera, severity, track_id)
+        sql = "SELECT COUNT(*) FROM events" + (" WHERE " + " AND ".join(where) if where else "")
+        with self._reader_lock:
+            return self._reader.execute(sql, params).fetchone()[0]
+
+    def thumbnail(self, event_id):
+        with self._reader_lock:
+            row = self._reader.execute("SELECT thumbnail FROM events WHERE id = ?", (event_id,)).fetchone()
+        return None if row is None else row[0]
+
+    def flush(self):
+        self._queue.join()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+        with self._reader_lock:
+            self._reader.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @staticmethod
+    def _filters(start, end, types, camera, severity, track_id):
+        where, params = [], []
+        if start is not None:
+            where.append("ts >= ?")
+            params.append(start)
+        if end is not None:
+            where.append("ts < ?")
+            params.append(end)
+        if types:
+            types = [types] if isinstance(types, str) else list(types)
+            where.append(f"type IN ({','.join('?' * len(types))})")
+            params.extend(types)
+        if camera is not None:
+            where.append("camera = ?")
+            params.append(camera)
+        if severity is not None:
+            where.append("severity = ?")
+            params.append(severity)
+        if track_id is not None:
+            where.append("id IN (SELECT event_id FROM event_tracks WHERE track_id = ?)")
+            params.append(track_id)
+        return where, params
+
+    def _writer(self):
+        conn = self._connect()
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            batch, done = [], 1
+            deadline = time.monotonic() + self.flush_interval
+            while item is not None:
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                    done += 1
+                except queue.Empty:
+                    break
+            stopping = item is None
+
+            try:
+                if batch:
+                    self._insert_batch(conn, batch)
+            finally:
+                for _ in range(done):
+                    self._queue.task_done()
+        conn.close()
+
+    def _insert_batch(self, conn, batch):
+        # قاعدة مقفلة من عملية أخرى أو قرص ممتلئ: نعيد المحاولة ثم نُسقط الدفعة، ولا يتوقف خيط الكتابة
+        for attempt in range(self.retries + 1):
+            try:
+                self._insert(conn, batch)
+                return
+            except Exception as e:
+                error = e
+                if attempt < self.retries:
+                    time.sleep(self.retry_delay * (attempt + 1))
+        self.failed += len(batch)
+        print(f"تعذر حفظ {len(batch)} حدث في {self.path}: {error}")
+
+    def _insert(self, conn, batch):
+        with conn:
+            cursor = conn.cursor()
+            for row, track_ids in batch:
+                cursor.execute("INSERT INTO events (camera, type, severity, ts, x, y, zone, details, image, video, "
+                               "thumbnail) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", row)
+                if track_ids:
+                    event_id = cursor.lastrowid
+                    cursor.executemany("INSERT INTO event_tracks (event_id, track_id) VALUES (?, ?)",
+                                       [(event_id, track_id) for track_id in track_ids])
+        self.written += len(batch)
+
+
+def parse_time(value):
+    return datetime.fromisoformat(value).timestamp() if value else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="البحث في سجل التنبيهات")
+    parser.add_argument('path', nargs='?', default='alerts/events.db')
+    parser.add_argument('--camera')
+    parser.add_argument('--type', action='append', dest='types')
+    parser.add_argument('--severity')
+    parser.add_argument('--track', type=int)
+    parser.add_argument('--from', dest='start', help="وقت البداية بصيغة ISO")
+    parser.add_argument('--to', dest='end', help="وقت النهاية بصيغة ISO")
+    parser.add_argument('--limit', type=int, default=50)
+    parser.add_argument('--count', action='store_true')
+    args = parser.parse_args(argv)
+
+    store = EventStore(args.path)
+    filters = dict(start=parse_time(args.start), end=parse_time(args.end), types=args.types, camera=args.camera,
+                   severity=args.severity, track_id=args.track)
+    if args.count:
+        print(store.count(**filters))
+        return 0
+
+    for event in store.query(limit=args.limit, **filters):
+        when = datetime.fromtimestamp(event['ts']).isoformat(sep=' ', timespec='seconds')
+        print(f"{event['id']:>8} {when} {event['camera']:<10} {event['type']:<9} {event['severity'] or '':<9} "
+              f"({event['x']}, {event['y']}) {event['zone'] or ''} {event['track_ids']} {event['details'] or ''}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+import cv2
+import numpy as np
+
+
+def build_fire_lut():
+    # قناة لكل مكوّن: درجة اللون (أحمر/برتقالي)، التشبع، السطوع
+    lut = np.zeros((1, 256, 3), dtype=np.uint8)
+    values = np.arange(256)
+    lut[0, :, 0] = np.where((values <= 25) | ((values >= 160) & (values <= 180)), 255, 0)
+    lut[0, :, 1] = np.where(values >= 100, 255, 0)
+    lut[0, :, 2] = np.where(values >= 100, 255, 0)
+    return lut
+
+
+class FireDetector:
+    def __init__(self, scale=0.25, roi=None, interval=1, cell_size=16, change_threshold=12,
+                 full_update_ratio=0.5, evidence_alpha=0.5, evidence_threshold=0.3,
+                 min_pixels=2000, min_ratio=0.01, interpolation=cv2.INTER_LINEAR):
+        self.scale = scale
+        self.interpolation = interpolation
+        self.roi = roi
+        self.interval = max(1, interval)
+        self.cell_size = cell_size
+        self.change_threshold = change_threshold
+        self.full_update_ratio = full_update_ratio
+        self.evidence_alpha = evidence_alpha
+        self.evidence_threshold = evidence_threshold * 255
+        self.min_pixels = min_pixels
+        self.min_ratio = min_ratio
+
+        self.lut = build_fire_lut()
+        self.frame_count = 0
+        self._shape = None
+
+    def detect(self, frame):
+        self.frame_count += 1
+        if (self.frame_count - 1) % self.interval:
+            return []
+
+        if self.roi is not None:
+            rx, ry, rw, rh = self.roi
+            source = frame[ry:ry + rh, rx:rx + rw]
+            offset = (rx, ry)
+        else:
+            source = frame
+            offset = (0, 0)
+
+        if self._shape != source.shape:
+            self._allocate(source.shape)
+
+        cv2.resize(source, self._size, dst=self._small, interpolation=self.interpolation)
+        cv2.cvtColor(self._small, cv2.COLOR_BGR2GRAY, dst=self._gray)
+        self._update_mask()
+        self._gray, self._prev_gray = self._prev_gray, self._gray
+
+        cv2.accumulateWeighted(self._mask, self._evidence, self.evidence_alpha)
+        cv2.compare(self._evidence, self.evidence_threshold, cv2.CMP_GT, dst=self._fire_mask)
+
+        return self._evaluate(source.shape, offset)
+
+    def _allocate(self, shape):
+        height, width = shape[:2]
+        cell = self.cell_size
+        small_w = max(cell, int(round(width * self.scale / cell)) * cell)
+        small_h = max(cell, int(round(height * self.scale / cell)) * cell)
+
+        self._shape = shape
+        self._size = (small_w, small_h)
+        self._grid = (small_h // cell, small_w // cell)
+        self._small = np.empty((small_h, small_w, 3), dtype=np.uint8)
+        self._gray = np.empty((small_h, small_w), dtype=np.uint8)
+        self._prev_gray = None
+        self._diff = np.empty((small_h, small_w), dtype=np.uint8)
+        self._mask = np.zeros((small_h, small_w), dtype=np.uint8)
+        self._fire_mask = np.zeros((small_h, small_w), dtype=np.uint8)
+        self._evidence = np.zeros((small_h, small_w), dtype=np.float32)
+
+    def _update_mask(self):
+        if self._prev_gray is None:
+            self._prev_gray = np.empty_like(self._gray)
+            self._classify(slice(None), slice(None))
+            return
+
+        cell = self.cell_size
+        cv2.absdiff(self._gray, self._prev_gray, dst=self._diff)
+        grid_h, grid_w = self._grid
+        changed = self._diff.reshape(grid_h, cell, grid_w, cell).max(axis=(1, 3)) > self.change_threshold
+
+        if changed.mean() > self.full_update_ratio:
+            self._classify(slice(None), slice(None))
+            return
+
+        # نعيد التصنيف فقط في نطاق الخلايا المتغيرة من كل صف
+        for row in np.flatnonzero(changed.any(axis=1)):
+            cols = np.flatnonzero(changed[row])
+            self._classify(slice(row * cell, (row + 1) * cell),
+                           slice(cols[0] * cell, (cols[-1] + 1) * cell))
+
+    def _classify(self, rows, cols):
+        hsv = cv2.cvtColor(self._small[rows, cols], cv2.COLOR_BGR2HSV)
+        classes = cv2.LUT(hsv, self.lut)
+        self._mask[rows, cols] = cv2.inRange(classes, (255, 255, 255), (255, 255, 255))
+
+    def _evaluate(self, shape, offset):
+        small_pixels = cv2.countNonZero(self._fire_mask)
+        if small_pixels == 0:
+            return []
+
+        small_h, small_w = self._fire_mask.shape
+        fire_ratio = small_pixels / (small_w * small_h)
+        fire_pixels = int(fire_ratio * shape[0] * shape[1])
+        if fire_pixels <= self.min_pixels or fire_ratio <= self.min_ratio:
+            return []
+
+        scale_x = shape[1] / small_w
+        scale_y = shape[0] / small_h
+        contours, _ = cv2.findContours(self._fire_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        if not contours:
+            return []
+
+        largest = max(contours, key=cv2.contourArea)
+        M = cv2.moments(largest)
+        if M["m00"] != 0:
+            cx = M["m10"] / M["m00"]
+            cy = M["m01"] / M["m00"]
+        else:
+            cx, cy = small_w / 2, small_h / 2
+
+        return [{
+            'type': 'fire',
+            'severity': 'critical',
+            'location': (int(cx * scale_x) + offset[0], int(cy * scale_y) + offset[1]),
+            'details': f'{fire_pixels}, {fire_ratio*100:.1f}%',
+            'key': 'fire_detected'
+        }]
@@ -0,0 +1,230 @@
+import threading
+from collections import deque
+
+import cv2
+import numpy as np
+
+
+class FramePin:
+    # مرجع إلى الإطارات [first, end) في المخزن بدل نسخها عند التنبيه، و end يبقى None حتى يكتمل ما بعد الحدث
+    def __init__(self, first):
+        self.first = first
+        self.end = None
+
+    def covers(self, sequence):
+        return self.first <= sequence and (self.end is None or sequence < self.end)
+
+    def __len__(self):
+        return 0 if self.end is None else self.end - self.first
+
+
+class PinnedFrames:
+    # الإطار الذي يحتاجه مقطع لم يُكتب بعد يُحفظ فقط لحظة خروجه من المخزن،
+    # وخيط الكتابة يقرأ الباقي من المخزن نفسه إطاراً إطاراً
+    # الميزانية تشمل المخزن والإطارات المحفوظة معاً، و pinned_share منها يبقى للإطارات المحفوظة
+    def __init__(self, memory_budget_mb=None, pinned_share=0.25, jpeg_quality=80):
+        self.memory_budget = None if memory_budget_mb is None else memory_budget_mb * 1024 * 1024
+        self.pinned_share = pinned_share
+        self.jpeg_params = [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality]
+        self.saved_bytes = 0
+        self.dropped_frames = 0
+        self._sequence = 0
+        self._pins = []
+        self._saved = {}
+        self._lock = threading.Lock()
+
+    @property
+    def buffer_budget(self):
+        return None if self.memory_budget is None else self.memory_budget * (1 - self.pinned_share)
+
+    def pin(self, last_n=None):
+        with self._lock:
+            count = len(self) if last_n is None else min(last_n, len(self))
+            pin = FramePin(self._sequence - count)
+            self._pins.append(pin)
+            return pin
+
+    def seal(self, pin):
+        with self._lock:
+            pin.end = self._sequence
+
+    def read(self, pin):
+        for sequence in range(pin.first, pin.end):
+            with self._lock:
+                entry = self._saved.get(sequence)
+                if entry is None and self._sequence - len(self) <= sequence < self._sequence:
+                    entry = self._resident(sequence)
+            if entry is not None:
+                yield self.decode(entry)
+
+    def release(self, pin):
+        with self._lock:
+            self._pins.remove(pin)
+            for sequence in [s for s in self._saved if not self._pinned(s)]:
+                self.saved_bytes -= self._saved.pop(sequence).nbytes
+
+    def decode(self, entry):
+        if entry.ndim == 1:
+            return cv2.imdecode(entry, cv2.IMREAD_COLOR)
+        return entry
+
+    def _pinned(self, sequence):
+        return any(pin.covers(sequence) for pin in self._pins)
+
+    def _evict(self, sequence, entry):
+        if self._pinned(sequence):
+            self._saved[sequence] = entry
+            self.saved_bytes += entry.nbytes
+            self._fit_budget()
+
+    def _over_budget(self):
+        return self.memory_budget is not None and self.nbytes + self.saved_bytes > self.memory_budget
+
+    def _fit_budget(self):
+        # تجاوز الميزانية: تُضغط الإطارات المحفوظة أولاً، ثم يُحذف أقدمها فيقصر ما قبل الحدث في المقطع
+        for sequence in sorted(self._saved):
+            if not self._over_budget():
+                return
+            entry = self._saved[sequence]
+            if entry.ndim == 1:
+                continue
+            ok, encoded = cv2.imencode('.jpg', entry, self.jpeg_params)
+            if ok:
+                self._saved[sequence] = encoded
+                self.saved_bytes += encoded.nbytes - entry.nbytes
+        for sequence in sorted(self._saved):
+            if not self._over_budget():
+                return
+            self.saved_bytes -= self._saved.pop(sequence).nbytes
+            self.dropped_frames += 1
+
+
+class FrameRingBuffer(PinnedFrames):
+    def __init__(self, capacity=150, memory_budget_mb=None, **options):
+        super().__init__(memory_budget_mb, **options)
+        self.max_capacity = capacity
+        self.memory_budget_mb = memory_budget_mb
+        self.capacity = 0
+        self._frames = None
+        self._start = 0
+        self._count = 0
+
+    def append(self, frame):
+        with self._lock:
+            if self._frames is None or self._frames.shape[1:] != frame.shape:
+                self._allocate(frame.shape, frame.dtype)
+            end = (self._start + self._count) % self.capacity
+            oldest = self._sequence - self._count
+            if self._count == self.capacity and self._pinned(oldest):
+                self._evict(oldest, self._frames[end].copy())
+            np.copyto(self._frames[end], frame)
+            if self._count < self.capacity:
+                self._count += 1
+            else:
+                self._start = (self._start + 1) % self.capacity
+            self._sequence += 1
+
+    def snapshot(self, last_n=None):
+        with self._lock:
+            return [frame.copy() for frame in self._ordered(last_n)]
+
+    def frames(self, last_n=None):
+        return self.snapshot(last_n)
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    @property
+    def nbytes(self):
+        return 0 if self._frames is None else self._frames.nbytes
+
+    def __len__(self):
+        return self._count
+
+    def _resident(self, sequence):
+        return self._frames[(self._start + sequence - self._sequence + self._count) % self.capacity].copy()
+
+    def _ordered(self, last_n):
+        count = self._count if last_n is None else min(last_n, self._count)
+        first = self._start + self._count - count
+        return [self._frames[(first + i) % self.capacity] for i in range(count)]
+
+    def _clear(self):
+        for sequence in range(self._sequence - self._count, self._sequence):
+            if self._pinned(sequence):
+                self._evict(sequence, self._resident(sequence))
+        self._start = 0
+        self._count = 0
+
+    def _allocate(self, shape, dtype):
+        if self._frames is not None:
+            self._clear()
+        frame_bytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        capacity = self.max_capacity
+        if self.buffer_budget is not None:
+            capacity = min(capacity, int(self.buffer_budget // frame_bytes))
+        self.capacity = max(1, capacity)
+        self._frames = np.empty((self.capacity,) + tuple(shape), dtype=dtype)
+        self._start = 0
+        self._count = 0
+
+
+class CompressedFrameBuffer(PinnedFrames):
+    def __init__(self, capacity=150, memory_budget_mb=None, mode='jpeg', jpeg_quality=80, scale=0.5,
+                 pinned_share=0.25):
+        if mode not in ('jpeg', 'downscale'):
+            raise ValueError(f"Unknown buffer mode: {mode}")
+        super().__init__(memory_budget_mb, pinned_share, jpeg_quality)
+        self.capacity = capacity
+        self.mode = mode
+        self.scale = scale
+        self._entries = deque()
+        self.nbytes = 0
+
+    def append(self, frame):
+        if self.mode == 'jpeg':
+            ok, entry = cv2.imencode('.jpg', frame, self.jpeg_params)
+            if not ok:
+                return
+        else:
+            entry = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+
+        with self._lock:
+            self._entries.append(entry)
+            self._sequence += 1
+            self.nbytes += entry.nbytes
+            while len(self._entries) > self.capacity or (
+                    self.buffer_budget is not None and self.nbytes > self.buffer_budget and len(self._entries) > 1):
+                self._pop()
+
+    def snapshot(self, last_n=None):
+        with self._lock:
+            entries = list(self._entries)
+        return entries if last_n is None else entries[-last_n:]
+
+    def frames(self, last_n=None):
+        return [self.decode(entry) for entry in self.snapshot(last_n)]
+
+    def clear(self):
+        with self._lock:
+            while self._entries:
+                self._pop()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _resident(self, sequence):
+        return self._entries[sequence - self._sequence + len(self._entries)]
+
+    def _pop(self):
+        sequence = self._sequence - len(self._entries)
+        entry = self._entries.popleft()
+        self.nbytes -= entry.nbytes
+        self._evict(sequence, entry)
+
+
+def create_frame_buffer(mode='raw', capacity=150, memory_budget_mb=None, **options):
+    if mode == 'raw':
+        return FrameRingBuffer(capacity, memory_budget_mb, **options)
+    return CompressedFrameBuffer(capacity, memory_budget_mb, mode=mode, **options)
@@ -0,0 +1,398 @@
+import abc
+import argparse
+import glob
+import os
+import sys
+import threading
+import time
+
+import cv2
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+from kalman_tracker import iou_matrix
+
+BACKENDS = ('torch', 'onnxruntime', 'openvino')
+
+
+class _Tensor(np.ndarray):
+    # نفس واجهة موترات PyTorch التي يستخدمها extract_detections
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return np.asarray(self)
+
+
+class DetectionBox:
+    def __init__(self, box, conf, cls):
+        self.xyxy = np.asarray([box], dtype=np.float32).view(_Tensor)
+        self.conf = np.asarray([conf], dtype=np.float32).view(_Tensor)
+        self.cls = np.asarray([cls], dtype=np.float32).view(_Tensor)
+
+
+class DetectionResult:
+    def __init__(self, boxes):
+        self.boxes = boxes
+
+
+def letterbox(frame, size=640, color=114):
+    height, width = frame.shape[:2]
+    scale = min(size / height, size / width)
+    new_w, new_h = int(round(width * scale)), int(round(height * scale))
+    pad_x, pad_y = (size - new_w) / 2, (size - new_h) / 2
+
+    canvas = np.full((size, size, 3), color, dtype=np.uint8)
+    top, left = int(round(pad_y - 0.1)), int(round(pad_x - 0.1))
+    canvas[top:top + new_h, left:left + new_w] = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    return canvas, scale, (left, top)
+
+
+def to_blob(images):
+    # BGR -> RGB، ثم NCHW بقيم بين 0 و 1
+    batch = np.stack(images)[..., ::-1].transpose(0, 3, 1, 2)
+    return np.ascontiguousarray(batch, dtype=np.float32) / 255.0
+
+
+def decode_output(output, scale, pad, shape, conf_threshold=0.25, iou_threshold=0.45, max_det=300):
+    # مخرج YOLOv8 بالشكل (4 + عدد الفئات, عدد المرشحين): cx, cy, w, h ثم درجة كل فئة
+    predictions = output.T
+    scores = predictions[:, 4:]
+    classes = scores.argmax(axis=1)
+    confidences = scores[np.arange(len(scores)), classes]
+    keep = confidences > conf_threshold
+    if not keep.any():
+        return []
+
+    cxcywh, confidences, classes = predictions[keep, :4], confidences[keep], classes[keep]
+    xywh = np.concatenate([cxcywh[:, :2] - cxcywh[:, 2:] / 2, cxcywh[:, 2:]], axis=1)
+    indices = cv2.dnn.NMSBoxesBatched(xywh.tolist(), confidences.tolist(), classes.tolist(),
+                                      conf_threshold, iou_threshold, top_k=max_det)
+    indices = np.asarray(indices, dtype=np.intp).reshape(-1)
+
+    boxes = np.concatenate([xywh[indices, :2], xywh[indices, :2] + xywh[indices, 2:]], axis=1)
+    boxes = (boxes - np.tile(pad, 2)) / scale
+    boxes[:, 0::2] = boxes[:, 0::2].clip(0, shape[1])
+    boxes[:, 1::2] = boxes[:, 1::2].clip(0, shape[0])
+    return [DetectionBox(box, conf, cls)
+            for box, conf, cls in zip(boxes.tolist(), confidences[indices].tolist(), classes[indices].tolist())]
+
+
+class OnnxYoloBackend(abc.ABC):
+    # المعالجة المسبقة واللاحقة مشتركة، وكل خلفية تنفذ _run فقط
+    backend = None
+
+    def __init__(self, model_path, input_size=640, conf_threshold=0.25, iou_threshold=0.45):
+        self.ckpt_path = model_path
+        self.input_size = input_size
+        self.conf_threshold = conf_threshold
+        self.iou_threshold = iou_threshold
+        self.batching = False
+
+    def __call__(self, source, verbose=False):
+        frames = source if isinstance(source, (list, tuple)) else [source]
+        prepared = [letterbox(frame, self.input_size) for frame in frames]
+
+        if self.batching:
+            outputs = self._run(to_blob([image for image, _, _ in prepared]))
+        else:
+            # النموذج المصدَّر بحجم دفعة ثابت يُشغَّل إطاراً إطاراً
+            outputs = np.concatenate([self._run(to_blob([image])) for image, _, _ in prepared])
+
+        return [DetectionResult(decode_output(output, scale, pad, frame.shape, self.conf_threshold,
+                                              self.iou_threshold))
+                for output, (_, scale, pad), frame in zip(outputs, prepared, frames)]
+
+    @abc.abstractmethod
+    def _run(self, blob):
+        # blob بالشكل NCHW، والناتج مخرج YOLOv8 الخام بالشكل (دفعة, 4 + عدد الفئات, عدد المرشحين)
+        ...
+
+
+class OnnxRuntimeBackend(OnnxYoloBackend):
+    backend = 'onnxruntime'
+
+    def __init__(self, model_path, threads=None, **options):
+        import onnxruntime as ort
+        super().__init__(model_path, **options)
+
+        session_options = ort.SessionOptions()
+        session_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            session_options.intra_op_num_threads = threads
+            session_options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(model_path, session_options, providers=['CPUExecutionProvider'])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.batching = not isinstance(model_input.shape[0], int)
+
+    def _run(self, blob):
+        return self.session.run(None, {self.input_name: blob})[0]
+
+
+class OpenVinoBackend(OnnxYoloBackend):
+    backend = 'openvino'
+
+    def __init__(self, model_path, threads=None, **options):
+        import openvino as ov
+        super().__init__(model_path, **options)
+
+        config = {'PERFORMANCE_HINT': 'LATENCY'}
+        if threads:
+            config['INFERENCE_NUM_THREADS'] = threads
+        core = ov.Core()
+        model = core.read_model(model_path)
+        self.batching = model.input(0).get_partial_shape()[0].is_dynamic
+        self.compiled = core.compile_model(model, 'CPU', config)
+        self.output = self.compiled.output(0)
+
+    def _run(self, blob):
+        return self.compiled([blob])[self.output]
+
+
+def export_onnx(weights='yolov8n.pt', output_dir='models', input_size=640):
+    # تصدير لمرة واحدة، والملف الناتج يُعاد استخدامه في كل تشغيل لاحق
+    path = os.path.join(output_dir, os.path.splitext(os.path.basename(weights))[0] + '.onnx')
+    if os.path.exists(path):
+        return path
+
+    from ultralytics import YOLO
+    print(f"تصدير {weights} إلى ONNX...")
+    os.makedirs(output_dir, exist_ok=True)
+    exported = YOLO(weights).export(format='onnx', imgsz=input_size, dynamic=True, simplify=True)
+    os.replace(exported, path)
+    return path
+
+
+def load_calibration_images(source, limit=200):
+    # مجلد صور أو ملف فيديو تؤخذ منه إطارات موزعة على طوله
+    if os.path.isdir(source):
+        paths = sorted(glob.glob(os.path.join(source, '*.jpg')) + glob.glob(os.path.join(source, '*.png')))
+        step = max(1, len(paths) // limit)
+        return [cv2.imread(path) for path in paths[::step][:limit]]
+
+    cap = cv2.VideoCapture(source)
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    step = max(1, total // limit)
+    frames = []
+    index = 0
+    while len(frames) < limit:
+        ret = cap.grab()
+        if not ret:
+            break
+        if index % step == 0:
+            ret, frame = cap.retrieve()
+            if ret:
+                frames.append(frame)
+        index += 1
+    cap.release()
+    return frames
+
+
+def quantize_int8(onnx_path, calibration, input_size=640, limit=200):
+    path = onnx_path.replace('.onnx', '_int8.onnx')
+    if os.path.exists(path):
+        return path
+
+    from onnxruntime.quantization import (CalibrationDataReader, QuantFormat, QuantType,
+                                          quantize_static)
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    images = load_calibration_images(calibration, limit)
+    if not images:
+        raise ValueError(f"No calibration images found in: {calibration}")
+    input_name = _input_name(onnx_path)
+
+    class Reader(CalibrationDataReader):
+        def __init__(self):
+            self.blobs = iter(to_blob([letterbox(image, input_size)[0]]) for image in images)
+
+        def get_next(self):
+            blob = next(self.blobs, None)
+            return None if blob is None else {input_name: blob}
+
+    print(f"تكميم INT8 باستخدام {len(images)} صورة معايرة...")
+    prepared = onnx_path.replace('.onnx', '_prep.onnx')
+    quant_pre_process(onnx_path, prepared)
+    quantize_static(prepared, path, Reader(), quant_format=QuantFormat.QDQ, per_channel=True,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+    os.remove(prepared)
+    return path
+
+
+def _input_name(onnx_path):
+    import onnx
+    return onnx.load(onnx_path, load_external_data=False).graph.input[0].name
+
+
+def create_backend(backend='torch', weights='yolov8n.pt', threads=None, int8=False, calibration=None,
+                   model_dir='models', input_size=640, **options):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend: {backend}")
+
+    if backend == 'torch':
+        from ultralytics import YOLO
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+        return YOLO(weights)
+
+    model_path = export_onnx(weights, model_dir, input_size)
+    if int8:
+        if calibration is None and not os.path.exists(model_path.replace('.onnx', '_int8.onnx')):
+            raise ValueError("INT8 quantization needs a calibration set (directory of images or a video)")
+        model_path = quantize_int8(model_path, calibration, input_size)
+
+    # OpenVINO يقرأ ملف ONNX مباشرة، بما فيه نموذج INT8 المكمم
+    backend_cls = OnnxRuntimeBackend if backend == 'onnxruntime' else OpenVinoBackend
+    return backend_cls(model_path, threads=threads, input_size=input_size, **options)
+
+
+class BackgroundModel:
+    # تحميل النموذج (واستيراد torch) وتسخينه في خيط خلفي حتى تظهر الواجهة فوراً
+    # أول استدعاء قبل اكتمال التحميل ينتظره، وخطأ التحميل يُرفع عند الاستدعاء
+    def __init__(self, backend='torch', backend_options=None, warmup=True, metrics=None):
+        self.backend = backend
+        self.backend_options = backend_options or {}
+        self.warmup = warmup
+        self.metrics = metrics
+        self.model = None
+        self.error = None
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._load, name="model-loader", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def wait(self, timeout=None):
+        if not self._ready.wait(timeout):
+            return None
+        if self.error is not None:
+            raise self.error
+        return self.model
+
+    def __call__(self, source, verbose=False):
+        return self.wait()(source, verbose=verbose)
+
+    def __getattr__(self, name):
+        # خصائص النموذج الأصلي (مثل ckpt_path) متاحة بعد التحميل
+        if name.startswith('_') or name in ('model', 'error'):
+            raise AttributeError(name)
+        return getattr(self.wait(), name)
+
+    def _load(self):
+        try:
+            start = time.perf_counter()
+            model = create_backend(self.backend, **self.backend_options)
+            self._report('model_load', time.perf_counter() - start)
+            if self.warmup:
+                start = time.perf_counter()
+                warmup_model(model, self.backend_options.get('input_size', 640))
+                self._report('model_warmup', time.perf_counter() - start)
+            self.model = model
+        except Exception as e:
+            self.error = e
+        finally:
+            self._ready.set()
+
+    def _report(self, phase, seconds):
+        if self.metrics is not None:
+            self.metrics.set_gauge('startup_seconds', round(seconds, 3), phase=phase)
+
+
+def warmup_model(model, input_size=640):
+    # أول استدعاء يحجز الذاكرة ويختار الخوارزميات، فنجريه على إطار فارغ قبل أول إطار حقيقي
+    model(np.zeros((input_size, input_size, 3), dtype=np.uint8), verbose=False)
+
+
+def match_detections(reference, detections, iou_threshold=0.5):
+    # مطابقة أحادية بين كشف المرجع وكشف الخلفية من نفس الفئة
+    if not reference or not detections:
+        return 0, []
+    ref_boxes = np.array([d['bbox'] for d in reference], dtype=np.float64)
+    boxes = np.array([d['bbox'] for d in detections], dtype=np.float64)
+    ious = iou_matrix(ref_boxes, boxes)
+    same_class = np.equal.outer([d['class'] for d in reference], [d['class'] for d in detections])
+    ious = np.where(same_class, ious, 0.0)
+    rows, cols = linear_sum_assignment(-ious)
+    matched = ious[rows, cols] >= iou_threshold
+    return int(matched.sum()), ious[rows, cols][matched].tolist()
+
+
+def compare_backends(specs, frames, reference='torch', warmup=3):
+    # يقارن السرعة والدقة (مقابل الخلفية المرجعية) على نفس الإطارات
+    from moraqab_system import MoraqabSystem
+    extract = MoraqabSystem.extract_detections
+
+    outputs = {}
+    results = []
+    for name, options in specs.items():
+        model = create_backend(**options)
+        for frame in frames[:warmup]:
+            model(frame, verbose=False)
+
+        detections = []
+        latencies = []
+        for frame in frames:
+            start = time.perf_counter()
+            raw = model(frame, verbose=False)
+            latencies.append(time.perf_counter() - start)
+            detections.append(extract(raw))
+        outputs[name] = detections
+
+        latencies = np.asarray(latencies)
+        results.append({
+            'backend': name,
+            'fps': len(latencies) / latencies.sum(),
+            'p50_ms': float(np.percentile(latencies, 50) * 1000),
+            'p99_ms': float(np.percentile(latencies, 99) * 1000),
+            'detections': sum(len(d) for d in detections)
+        })
+
+    if reference in outputs:
+        for result in results:
+            matched, ious = 0, []
+            for ref, dets in zip(outputs[reference], outputs[result['backend']]):
+                count, frame_ious = match_detections(ref, dets)
+                matched += count
+                ious.extend(frame_ious)
+            ref_total = sum(len(d) for d in outputs[reference])
+            result['recall'] = matched / ref_total if ref_total else 1.0
+            result['precision'] = matched / result['detections'] if result['detections'] else 1.0
+            result['mean_iou'] = float(np.mean(ious)) if ious else 0.0
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="مقارنة خلفيات الاستدلال من حيث السرعة والدقة")
+    parser.add_argument('source', help="ملف فيديو أو مجلد صور للمقارنة")
+    parser.add_argument('--backends', default='torch,onnxruntime,openvino',
+                        help="قائمة مفصولة بفواصل، وأضف -int8 للنسخة المكممة (مثل onnxruntime-int8)")
+    parser.add_argument('--weights', default='yolov8n.pt')
+    parser.add_argument('--threads', type=int)
+    parser.add_argument('--calibration', help="صور أو فيديو المعايرة لنماذج INT8")
+    parser.add_argument('--frames', type=int, default=100)
+    args = parser.parse_args(argv)
+
+    specs = {}
+    for name in args.backends.split(','):
+        backend, _, variant = name.partition('-')
+        specs[name] = {'backend': backend, 'weights': args.weights, 'threads': args.threads,
+                       'int8': variant == 'int8', 'calibration': args.calibration or args.source}
+    frames = load_calibration_images(args.source, args.frames)
+    results = compare_backends(specs, frames, reference=next(iter(specs)))
+
+    print(f"\n{'backend':<22}{'fps':>8}{'p50 ms':>10}{'p99 ms':>10}{'recall':>9}{'precision':>11}{'IoU':>7}")
+    for r in results:
+        print(f"{r['backend']:<22}{r['fps']:>8.1f}{r['p50_ms']:>10.2f}{r['p99_ms']:>10.2f}"
+              f"{r.get('recall', 0):>9.3f}{r.get('precision', 0):>11.3f}{r.get('mean_iou', 0):>7.3f}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,192 @@
+import numpy as np
+from filterpy.common import Q_discrete_white_noise
+from scipy.optimize import linear_sum_assignment
+
+
+def iou_matrix(boxes_a, boxes_b):
+    a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 1, 4)
+    b = np.asarray(boxes_b, dtype=np.float32).reshape(1, -1, 4)
+
+    inter_w = np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+    inter_h = np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+    inter = inter_w * inter_h
+
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    union = area_a + area_b - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-6), 0.0)
+
+
+class KalmanTracker:
+    # الحالة: [cx, cy, w, h, vx, vy, vw, vh] بسرعة ثابتة لكل مسار
+    DIM_X = 8
+    DIM_Z = 4
+
+    def __init__(self, max_disappeared=30, gating='mahalanobis', iou_threshold=0.3,
+                 gate_threshold=9.4877, process_noise=1.0, measurement_noise=10.0,
+                 match_classes=False, capacity=64):
+        if gating not in ('mahalanobis', 'iou'):
+            raise ValueError(f"Unknown gating mode: {gating}")
+
+        self.next_id = 1
+        self.max_disappeared = max_disappeared
+        self.gating = gating
+        self.iou_threshold = iou_threshold
+        self.gate_threshold = gate_threshold
+        self.match_classes = match_classes
+
+        self.F = np.eye(self.DIM_X)
+        self.F[:4, 4:] = np.eye(4)
+        self.Q = Q_discrete_white_noise(dim=2, dt=1.0, var=process_noise,
+                                        block_size=4, order_by_dim=False)
+        self.R = np.eye(self.DIM_Z) * measurement_noise
+        self.P0 = np.diag([10.0] * 4 + [10000.0] * 4)
+
+        self.capacity = capacity
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.x = np.zeros((capacity, self.DIM_X))
+        self.P = np.zeros((capacity, self.DIM_X, self.DIM_X))
+        self.classes = np.zeros(capacity, dtype=np.int32)
+        self.disappeared = np.zeros(capacity, dtype=np.int32)
+        self.active = np.zeros(capacity, dtype=bool)
+
+        self.removed_ids = []
+
+    def predict(self):
+        slots = np.flatnonzero(self.active)
+        if len(slots):
+            self.x[slots] = self.x[slots] @ self.F.T
+            self.x[slots, 2:4] = np.maximum(self.x[slots, 2:4], 1.0)
+            self.P[slots] = self.F @ self.P[slots] @ self.F.T + self.Q
+        return self.get_objects()
+
+    def age(self):
+        # إطار ساكن: الحالة لا تتحرك، لكن عدم اليقين يزداد مع مرور الوقت
+        self.removed_ids = []
+        slots = np.flatnonzero(self.active)
+        if len(slots):
+            self.P[slots] += self.Q
+        return self.get_objects()
+
+    def update(self, detections):
+        self.removed_ids = []
+        self.predict()
+        slots = np.flatnonzero(self.active)
+
+        if len(detections) == 0:
+            self._mark_missed(slots)
+            return self.get_objects()
+
+        boxes = np.array([det['bbox'] for det in detections], dtype=np.float64).reshape(-1, 4)
+        classes = np.array([det['class'] for det in detections], dtype=np.int32)
+        z = self._to_measurement(boxes)
+
+        matched_slots, matched_cols = self._match(slots, boxes, z, classes)
+        self._correct(matched_slots, z[matched_cols])
+        self.disappeared[matched_slots] = 0
+
+        self._mark_missed(np.setdiff1d(slots, matched_slots, assume_unique=True))
+
+        unmatched_cols = np.setdiff1d(np.arange(len(boxes)), matched_cols, assume_unique=True)
+        self._register(z[unmatched_cols], classes[unmatched_cols])
+
+        return self.get_objects()
+
+    def get_objects(self):
+        slots = np.flatnonzero(self.active)
+        boxes = self._to_boxes(self.x[slots, :4]).round().astype(int)
+        centers = self.x[slots, :2].round().astype(int)
+        return [
+            {'id': object_id, 'center': tuple(center), 'bbox': tuple(bbox), 'class': obj_class}
+            for object_id, center, bbox, obj_class in zip(
+                self.ids[slots].tolist(),
+                centers.tolist(),
+                boxes.tolist(),
+                self.classes[slots].tolist()
+            )
+        ]
+
+    def _match(self, slots, boxes, z, classes):
+        if len(slots) == 0:
+            return slots, np.zeros(0, dtype=np.intp)
+
+        if self.gating == 'iou':
+            iou = iou_matrix(self._to_boxes(self.x[slots, :4]), boxes)
+            cost = 1.0 - iou
+            gated = iou < self.iou_threshold
+        else:
+            S = self.P[slots, :4, :4] + self.R
+            S_inv = np.linalg.inv(S)
+            y = z[None, :, :] - self.x[slots, None, :4]
+            cost = np.einsum('tdi,tij,tdj->td', y, S_inv, y)
+            gated = cost > self.gate_threshold
+
+        if self.match_classes:
+            gated |= self.classes[slots, None] != classes[None, :]
+        cost = np.where(gated, 1e9, cost)
+
+        rows, cols = linear_sum_assignment(cost)
+        keep = ~gated[rows, cols]
+        return slots[rows[keep]], cols[keep]
+
+    def _correct(self, slots, z):
+        if len(slots) == 0:
+            return
+        P = self.P[slots]
+        S = P[:, :4, :4] + self.R
+        K = P[:, :, :4] @ np.linalg.inv(S)
+        y = z - self.x[slots, :4]
+        self.x[slots] += np.einsum('nij,nj->ni', K, y)
+        self.P[slots] = P - K @ P[:, :4, :]
+
+    def _mark_missed(self, slots):
+        if len(slots) == 0:
+            return
+        self.disappeared[slots] += 1
+        expired = slots[self.disappeared[slots] > self.max_disappeared]
+        if len(expired):
+            self.removed_ids.extend(self.ids[expired].tolist())
+            self.active[expired] = False
+
+    def _register(self, z, classes):
+        count = len(z)
+        if count == 0:
+            return
+
+        free = np.flatnonzero(~self.active)
+        if len(free) < count:
+            self._grow(self.capacity + count - len(free))
+            free = np.flatnonzero(~self.active)
+        slots = free[:count]
+
+        self.ids[slots] = np.arange(self.next_id, self.next_id + count)
+        self.x[slots] = 0.0
+        self.x[slots, :4] = z
+        self.P[slots] = self.P0
+        self.classes[slots] = classes
+        self.disappeared[slots] = 0
+        self.active[slots] = True
+        self.next_id += count
+
+    def _grow(self, min_capacity):
+        capacity = max(min_capacity, self.capacity * 2)
+        extra = capacity - self.capacity
+        self.ids = np.concatenate([self.ids, np.zeros(extra, dtype=self.ids.dtype)])
+        self.x = np.concatenate([self.x, np.zeros((extra, self.DIM_X))])
+        self.P = np.concatenate([self.P, np.zeros((extra, self.DIM_X, self.DIM_X))])
+        self.classes = np.concatenate([self.classes, np.zeros(extra, dtype=self.classes.dtype)])
+        self.disappeared = np.concatenate([self.disappeared, np.zeros(extra, dtype=self.disappeared.dtype)])
+        self.active = np.concatenate([self.active, np.zeros(extra, dtype=bool)])
+        self.capacity = capacity
+
+    @staticmethod
+    def _to_measurement(boxes):
+        w = boxes[:, 2] - boxes[:, 0]
+        h = boxes[:, 3] - boxes[:, 1]
+        return np.stack([boxes[:, 0] + w / 2, boxes[:, 1] + h / 2, w, h], axis=1)
+
+    @staticmethod
+    def _to_boxes(z):
+        half_w = z[:, 2] / 2
+        half_h = z[:, 3] / 2
+        return np.stack([z[:, 0] - half_w, z[:, 1] - half_h, z[:, 0] + half_w, z[:, 1] + half_h], axis=1)
@@ -0,0 +1,148 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+
+class RollingHistogram:
+    BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0)
+
+    def __init__(self, window=512):
+        self.window = window
+        self.samples = np.zeros(window)
+        self.bucket_counts = [0] * (len(self.BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.started = time.perf_counter()
+
+    def observe(self, seconds):
+        self.samples[self.count % self.window] = seconds
+        self.count += 1
+        self.total += seconds
+        for i, bound in enumerate(self.BUCKETS):
+            if seconds <= bound:
+                self.bucket_counts[i] += 1
+                return
+        self.bucket_counts[-1] += 1
+
+    def summary(self):
+        recent = self.samples[:min(self.count, self.window)]
+        if len(recent) == 0:
+            return {'count': 0, 'mean_ms': 0.0, 'p50_ms': 0.0, 'p99_ms': 0.0, 'rate': 0.0}
+        p50, p99 = np.percentile(recent, [50, 99]) * 1000
+        elapsed = time.perf_counter() - self.started
+        return {
+            'count': self.count,
+            'mean_ms': float(recent.mean() * 1000),
+            'p50_ms': float(p50),
+            'p99_ms': float(p99),
+            'rate': self.count / elapsed if elapsed > 0 else 0.0
+        }
+
+
+class Metrics:
+    def __init__(self, window=512):
+        self.window = window
+        self._timers = {}
+        self._counters = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds, stream=''):
+        key = (stage, stream)
+        with self._lock:
+            histogram = self._timers.get(key)
+            if histogram is None:
+                histogram = self._timers[key] = RollingHistogram(self.window)
+            histogram.observe(seconds)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        # القيمة قد تكون رقماً أو دالة تُستدعى عند أخذ اللقطة (مثل عمق الطوابير)
+        self._gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def snapshot(self):
+        with self._lock:
+            stages = {key: histogram.summary() for key, histogram in self._timers.items()}
+            counters = dict(self._counters)
+        gauges = {key: value() if callable(value) else value for key, value in list(self._gauges.items())}
+
+        return {
+            'stages': {f"{stream}.{stage}" if stream else stage: summary
+                       for (stage, stream), summary in stages.items()},
+            'counters': {_format_key(name, labels): value for (name, labels), value in counters.items()},
+            'gauges': {_format_key(name, labels): value for (name, labels), value in gauges.items()}
+        }
+
+    def render_prometheus(self):
+        lines = ['# TYPE moraqab_stage_seconds histogram']
+        with self._lock:
+            timers = [(key, list(h.bucket_counts), h.total, h.count) for key, h in self._timers.items()]
+            counters = dict(self._counters)
+        gauges = {key: value() if callable(value) else value for key, value in list(self._gauges.items())}
+
+        for (stage, stream), bucket_counts, total, count in timers:
+            labels = f'stage="{stage}",stream="{stream}"'
+            cumulative = 0
+            for bound, bucket in zip(RollingHistogram.BUCKETS + ('+Inf',), bucket_counts):
+                cumulative += bucket
+                lines.append(f'moraqab_stage_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'moraqab_stage_seconds_sum{{{labels}}} {total}')
+            lines.append(f'moraqab_stage_seconds_count{{{labels}}} {count}')
+
+        for kind, values, suffix in (('counter', counters, '_total'), ('gauge', gauges, '')):
+            for name in sorted({name for name, _ in values}):
+                lines.append(f'# TYPE moraqab_{name}{suffix} {kind}')
+                for (metric, labels), value in values.items():
+                    if metric == name:
+                        label_text = ','.join(f'{k}="{v}"' for k, v in labels)
+                        label_text = f'{{{label_text}}}' if label_text else ''
+                        lines.append(f'moraqab_{name}{suffix}{label_text} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def _format_key(name, labels):
+    if not labels:
+        return name
+    return name + '{' + ','.join(f'{k}={v}' for k, v in labels) + '}'
+
+
+class MetricsServer:
+    # المنفذ يُحدد صراحة: المنافذ الشائعة (مثل 9100 لـ node_exporter) محجوزة غالباً على الأجهزة المراقبة،
+    # و port=0 يختار منفذاً متاحاً يُقرأ من address
+    def __init__(self, metrics, port, host='127.0.0.1'):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = metrics.render_prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def address(self):
+        return self.server.server_address
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
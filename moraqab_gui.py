@@ -1,22 +1,43 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import cv2
-from PIL import Image, ImageTk
+import numpy as np
 import threading
+import time
 from moraqab_system import MoraqabSystem
 
 class MoraqabGUI:
     def __init__(self, root):
+        self._started = time.perf_counter()
         self.root = root
         self.root.title("نظام مرقاب - Moraqab System")
         self.root.geometry("1200x800")
         
-        self.system = MoraqabSystem()
+        # النموذج يُحمّل ويُسخّن في الخلفية، والنافذة تظهر دون انتظاره
+        self.system = MoraqabSystem(background_load=True)
+        self._window_shown = False
+        self._model_ready = False
         self.video_thread = None
         self.running = False
         self.current_frame = None
+        # 0: المعالجة بخيوط داخل هذه العملية، وأكثر من ذلك: عمليات منفصلة تقرأ الإطارات من ذاكرة مشتركة
+        self.workers = 0
+        
+        # خيط المعالجة يكتب أحدث نتيجة فقط، وحلقة Tk تسحبها بمعدل عرض محدود
+        self.display_fps = 20
+        self.stats_interval = 0.5
+        self._slot_lock = threading.Lock()
+        self._latest = None
+        self._pending_alerts = []
+        self._status = None
+        self._last_stats_update = 0.0
+        self._photo = None
+        self._annotated = None
+        self._resized = None
+        self._rgb = None
         
         self.create_widgets()
+        self.root.after(0, self._poll)
         
     def create_widgets(self):
         control_frame = ttk.Frame(self.root, padding="10")
@@ -94,63 +115,104 @@ class MoraqabGUI:
         self.video_thread.start()
     
     def process_video(self, source):
-        cap = cv2.VideoCapture(source)
-        
-        if not cap.isOpened():
-            self.status_label.config(text="❌ خطأ: لا يمكن فتح المصدر")
+        try:
+            # الرسم على الإطار يتم في حلقة Tk للإطارات المعروضة فقط
+            self.system.run(source, on_result=self.on_result, annotate=False, workers=self.workers)
+        except IOError:
             self.running = False
+            self._set_status("❌ خطأ: لا يمكن فتح المصدر")
             return
         
-        frame_count = 0
-        alert_count = 0
-        behavior_counts = {'fighting': 0, 'fire': 0, 'fall': 0, 'crowd': 0}
+        self.running = False
+        self._set_status("⏹ متوقف")
+    
+    def on_result(self, result):
+        # يُستدعى من خيط المعالجة: لا لمس للواجهة هنا، فقط استبدال النتيجة الأخيرة
+        with self._slot_lock:
+            self._latest = result
+            if result['behaviors']:
+                self._pending_alerts.extend(result['behaviors'])
+    
+    def _set_status(self, text):
+        with self._slot_lock:
+            self._status = text
+    
+    def _poll(self):
+        if not self._model_ready:
+            self._check_startup()
         
-        while self.running:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            
-            frame_count += 1
-            self.system.alert_system.add_frame_to_buffer(frame)
-            
-            results = self.system.model(frame, verbose=False)
-            detections = self.system.extract_detections(results)
-            tracked_objects = self.system.tracker.update(detections)
-            behaviors = self.system.behavior_detector.detect_behaviors(tracked_objects, frame)
-            
-            for behavior in behaviors:
-                alert_count += 1
-                behavior_type = behavior['type']
-                if behavior_type in behavior_counts:
-                    behavior_counts[behavior_type] += 1
-                self.system.alert_system.trigger_alert(behavior, frame)
-                self.add_alert(behavior)
+        with self._slot_lock:
+            result, self._latest = self._latest, None
+            alerts, self._pending_alerts = self._pending_alerts, []
+            status, self._status = self._status, None
+        
+        for behavior in alerts:
+            self.add_alert(behavior)
+        if status is not None:
+            self.status_label.config(text=status)
+        
+        if result is not None:
+            start = time.perf_counter()
+            self._annotated = self.system.draw_annotations(result['frame'], result['tracked_objects'],
+                                                           result['behaviors'], out=self._annotated)
+            self.update_video_display(self._annotated)
+            self.system.metrics.observe('render', time.perf_counter() - start)
             
-            display_frame = self.system.draw_annotations(frame, tracked_objects, behaviors)
-            self.update_video_display(display_frame)
-            self.update_stats(frame_count, alert_count, len(tracked_objects), behavior_counts)
+            now = time.perf_counter()
+            if now - self._last_stats_update >= self.stats_interval:
+                self._last_stats_update = now
+                stats = result['stats']
+                self.update_stats(stats['frames'], stats['alerts'], len(result['tracked_objects']),
+                                  stats['behavior_counts'], stats['skipped'])
         
-        cap.release()
-        self.running = False
-        self.status_label.config(text="⏹ متوقف")
+        self.root.after(int(1000 / self.display_fps), self._poll)
+    
+    def _check_startup(self):
+        # أول دورة لحلقة Tk تعني أن النافذة ظهرت، والزمنان يظهران في المقاييس مع زمني التحميل والتسخين
+        elapsed = round(time.perf_counter() - self._started, 3)
+        if not self._window_shown:
+            self._window_shown = True
+            self.system.metrics.set_gauge('startup_seconds', elapsed, phase='window')
+        if not self.system.model_ready:
+            if not self.running:
+                self.status_label.config(text="⏳ جاري تحميل النموذج...")
+            return
+        self._model_ready = True
+        self.system.metrics.set_gauge('startup_seconds', elapsed, phase='model_ready')
+        if getattr(self.system.model, 'error', None) is not None:
+            self.status_label.config(text="❌ خطأ: تعذر تحميل النموذج")
+        elif not self.running:
+            self.status_label.config(text="✅ جاهز")
     
     def update_video_display(self, frame):
-        try:
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            frame_resized = cv2.resize(frame_rgb, (800, 600))
-            img = Image.fromarray(frame_resized)
-            imgtk = ImageTk.PhotoImage(image=img)
-            self.video_label.imgtk = imgtk
-            self.video_label.configure(image=imgtk)
-        except:
-            pass
+        # التصغير أولاً ثم تحويل الألوان على الصورة الصغيرة، بمقاس العنصر الفعلي
+        width, height = self.video_label.winfo_width(), self.video_label.winfo_height()
+        if width <= 1 or height <= 1:
+            width, height = 800, 600
+        scale = min(width / frame.shape[1], height / frame.shape[0])
+        size = (max(1, int(frame.shape[1] * scale)), max(1, int(frame.shape[0] * scale)))
+        
+        if self._resized is None or self._resized.shape[1::-1] != size:
+            self._resized = np.empty((size[1], size[0], 3), dtype=np.uint8)
+            self._rgb = np.empty_like(self._resized)
+        cv2.resize(frame, size, dst=self._resized, interpolation=cv2.INTER_LINEAR)
+        cv2.cvtColor(self._resized, cv2.COLOR_BGR2RGB, dst=self._rgb)
+        from PIL import Image, ImageTk
+        img = Image.fromarray(self._rgb)
+        
+        if self._photo is not None and (self._photo.width(), self._photo.height()) == size:
+            self._photo.paste(img)
+        else:
+            self._photo = ImageTk.PhotoImage(image=img)
+            self.video_label.configure(image=self._photo)
     
-    def update_stats(self, frames, alerts, objects, behavior_counts):
+    def update_stats(self, frames, alerts, objects, behavior_counts, skipped=0):
         self.stats_text.delete(1.0, tk.END)
         stats = f"""
 📊 الإحصائيات:
 
 الإطارات المعالجة: {frames}
+الإطارات الساكنة المتخطاة: {skipped}
 إجمالي التنبيهات: {alerts}
 الكائنات المتتبعة: {objects}
 
@@ -160,9 +222,20 @@ class MoraqabGUI:
 🔥 حريق: {behavior_counts.get('fire', 0)}
 💥 سقوط/حادث: {behavior_counts.get('fall', 0)}
 👥 تجمع مشبوه: {behavior_counts.get('crowd', 0)}
+
+⏱ زمن المراحل (p50 / p99 ms):
+{self._format_stage_breakdown()}
         """
         self.stats_text.insert(1.0, stats)
     
+    def _format_stage_breakdown(self):
+        snapshot = self.system.get_metrics()
+        lines = [f"{stage}: {s['p50_ms']:.1f} / {s['p99_ms']:.1f}"
+                 for stage, s in sorted(snapshot['stages'].items())]
+        dropped = sum(value for key, value in snapshot['gauges'].items() if key.startswith('queue_dropped'))
+        lines.append(f"الإطارات المُسقطة: {dropped}")
+        return '\n'.join(lines)
+    
     def add_alert(self, behavior):
         behavior_names = {
             'fighting': '🥊 شجار',
@@ -1,22 +1,302 @@
+import argparse
 import cv2
-import sys
-from ultralytics import YOLO
+import numpy as np
+import os
+import time
 from tracker import ObjectTracker
+from kalman_tracker import KalmanTracker
 from behavior_detector import BehaviorDetector
 from alert_system import AlertSystem
+from pipeline import CameraStream, Pipeline
+from scheduler import DetectionScheduler
+from metrics import Metrics, MetricsServer
+from detection_cache import DetectionCache, DetectionCacheWriter, model_name
+from inference_backend import BackgroundModel, create_backend, warmup_model
+from zones import ZoneLayout
+from event_store import EventStore
+from process_pipeline import ProcessPipeline
 
 class MoraqabSystem:
-    def __init__(self):
+    behavior_names = {
+        'fighting': 'شجار',
+        'fire': 'حريق',
+        'fall': 'سقوط',
+        'crowd': 'تجمع'
+    }
+
+    def __init__(self, tracker_type='centroid', detection_interval=1, adaptive_detection=False,
+                 motion_gate=False, scheduler_options=None, alert_options=None, behavior_options=None, model=None,
+                 backend='torch', backend_options=None, zones=None, zone_options=None,
+                 store_events=True, decode_options=None, background_load=False, warmup=True):
+        started = time.perf_counter()
         print("تهيئة نظام مرقاب...")
-        print("تحميل نموذج YOLOv8n...")
-        self.model = YOLO('yolov8n.pt')
-        self.tracker = ObjectTracker()
-        self.behavior_detector = BehaviorDetector()
-        self.alert_system = AlertSystem()
+        # نفس الإعدادات تُمرر لعمليات العمال في الوضع متعدد العمليات
+        self.options = dict(tracker_type=tracker_type, detection_interval=detection_interval,
+                            adaptive_detection=adaptive_detection, motion_gate=motion_gate,
+                            scheduler_options=scheduler_options, alert_options=alert_options,
+                            behavior_options=behavior_options, model=model, backend=backend,
+                            backend_options=backend_options, zones=zones, zone_options=zone_options,
+                            store_events=store_events, decode_options=decode_options,
+                            background_load=background_load, warmup=warmup)
+        self.metrics = Metrics()
+        self.metrics_server = None
+        if model is None and background_load:
+            # الواجهة تعمل فوراً، والكشف ينتظر اكتمال التحميل عند أول إطار
+            print(f"تحميل نموذج YOLOv8n ({backend}) في الخلفية...")
+            model = BackgroundModel(backend, backend_options, warmup, self.metrics).start()
+        elif model is None:
+            # torch عبر ultralytics، أو ONNX Runtime / OpenVINO على المعالج بعد تصدير لمرة واحدة
+            print(f"تحميل نموذج YOLOv8n ({backend})...")
+            start = time.perf_counter()
+            model = create_backend(backend, **(backend_options or {}))
+            self.metrics.set_gauge('startup_seconds', round(time.perf_counter() - start, 3), phase='model_load')
+            if warmup:
+                start = time.perf_counter()
+                warmup_model(model, (backend_options or {}).get('input_size', 640))
+                self.metrics.set_gauge('startup_seconds', round(time.perf_counter() - start, 3),
+                                       phase='model_warmup')
+        self.model = model
+        self.tracker_type = tracker_type
+        self.tracker = self.create_tracker()
+        # مناطق مضلعة لكل كاميرا: قائمة لكل الكاميرات، أو قاموس باسم الكاميرا ('*' للبقية)
+        self.zones = zones
+        self.zone_options = zone_options or {}
+        self.zone_layout = self.create_zone_layout('cam0')
+        self.behavior_options = behavior_options or {}
+        self.behavior_detector = BehaviorDetector(**self.behavior_options, zones=self.zone_layout)
+        self.alert_options = alert_options or {}
+        # سجل أحداث SQLite واحد لكل الكاميرات بدل البحث في ملفات الصور والمقاطع
+        self.event_store = None
+        if store_events:
+            self.event_store = EventStore(os.path.join(self.alert_options.get('output_dir', 'alerts'), 'events.db'))
+        self.alert_system = AlertSystem(**self.alert_options, metrics=self.metrics, event_store=self.event_store,
+                                        camera='cam0')
+        # تشغيل YOLO كل N إطار، والمتتبع يتنبأ بالمواقع بينها
+        # في الوضع التكيفي يعود الكشف لكل إطار عند الحركة أو الازدحام أو وجود تنبيه
+        self.detection_interval = max(1, detection_interval)
+        self.adaptive_detection = adaptive_detection
+        # بوابة الحركة تتخطى الإطارات الساكنة تماماً (كاميرات الممرات الفارغة)
+        self.motion_gate = motion_gate
+        self.scheduler_options = scheduler_options or {}
+        self.scheduler = self.create_scheduler()
+        # خيارات VideoSource: max_size يصغر الإطار عند الفك (إحداثيات المناطق بمقاس الإطار المصغر)،
+        # و sample_fps يأخذ عينات من الملفات للمسح السريع، و start للبدء من ثانية معينة
+        self.decode_options = decode_options or {}
+        self.pipeline = None
         self.running = False
+        self.metrics.set_gauge('startup_seconds', round(time.perf_counter() - started, 3), phase='init')
+        self.metrics.set_gauge('model_ready', lambda: int(self.model_ready))
         print("تم تهيئة النظام بنجاح!")
 
-    def extract_detections(self, results):
+    @property
+    def model_ready(self):
+        return getattr(self.model, 'ready', True)
+
+    @property
+    def model_name(self):
+        # مع التحميل في الخلفية ينتظر النموذج، لذا لا يُحسب إلا عند استخدام ذاكرة الكشف
+        return model_name(self.model)
+
+    def create_tracker(self):
+        if self.tracker_type == 'kalman':
+            return KalmanTracker()
+        if self.tracker_type == 'centroid':
+            return ObjectTracker()
+        raise ValueError(f"Unknown tracker type: {self.tracker_type}")
+
+    def create_zone_layout(self, name):
+        zones = self.zones
+        if isinstance(zones, dict):
+            zones = zones.get(name, zones.get('*'))
+        return ZoneLayout(zones, **self.zone_options) if zones else None
+
+    def create_scheduler(self):
+        options = dict({'motion_gate': self.motion_gate}, **self.scheduler_options)
+        return DetectionScheduler(self.detection_interval, self.adaptive_detection, **options)
+
+    def detect(self, frame, zones=None):
+        if zones is not None:
+            return self.detect_batch([frame], [zones])[0]
+        start = time.perf_counter()
+        results = self.model(frame, verbose=False)
+        self.metrics.observe('inference', time.perf_counter() - start)
+
+        start = time.perf_counter()
+        detections = self.extract_detections(results)
+        self.metrics.observe('extract_detections', time.perf_counter() - start)
+        return detections
+
+    def detect_batch(self, frames, zones=None):
+        # الإطارات ذات المناطق تُقص إلى المستطيلات المحيطة بها، وكل القصاصات في دفعة واحدة للنموذج
+        zones = zones or [None] * len(frames)
+        crops, counts = [], []
+        for frame, layout in zip(frames, zones):
+            frame_crops = layout.crops(frame) if layout is not None else [frame]
+            crops.extend(frame_crops)
+            counts.append(len(frame_crops))
+
+        start = time.perf_counter()
+        results = self.model(crops, verbose=False)
+        self.metrics.observe('inference', time.perf_counter() - start)
+        self.metrics.inc('inference_frames', len(frames))
+
+        start = time.perf_counter()
+        crop_detections = [self.extract_detections([result]) for result in results]
+        detections = []
+        for frame, layout, count in zip(frames, zones, counts):
+            frame_detections, crop_detections = crop_detections[:count], crop_detections[count:]
+            detections.append(layout.merge(frame_detections, frame.shape) if layout is not None
+                              else frame_detections[0])
+        self.metrics.observe('extract_detections', time.perf_counter() - start)
+        return detections
+
+    def get_metrics(self):
+        return self.metrics.snapshot()
+
+    def start_metrics_server(self, port, host='127.0.0.1'):
+        # نقطة نصية محلية بصيغة Prometheus
+        if self.metrics_server is None:
+            self.metrics_server = MetricsServer(self.metrics, port, host).start()
+        return self.metrics_server
+
+    def create_stream(self, source, name, alert_options=None):
+        # كل كاميرا لها متتبع وكاشف سلوك ونظام تنبيه خاص بها، والنموذج مشترك
+        options = dict(self.alert_options, **(alert_options or {}))
+        options['output_dir'] = os.path.join(self.alert_system.output_dir, name)
+        zones = self.create_zone_layout(name)
+        behavior_detector = BehaviorDetector(**self.behavior_options, zones=zones)
+        return CameraStream(name, source, self.create_tracker(), behavior_detector,
+                            AlertSystem(**options, metrics=self.metrics, event_store=self.event_store, camera=name),
+                            self.create_scheduler(), zones=zones, decode_options=self.decode_options)
+
+    def run(self, source, on_result=None, block=True, annotate=True, workers=0, process_options=None):
+        if workers:
+            return self.run_processes(source, on_result, block, annotate, workers, process_options)
+
+        if isinstance(source, (list, tuple)):
+            streams = [self.create_stream(src, f"cam{i}") for i, src in enumerate(source)]
+        else:
+            streams = [CameraStream('cam0', source, self.tracker, self.behavior_detector, self.alert_system,
+                                    self.scheduler, zones=self.zone_layout, decode_options=self.decode_options)]
+
+        self.pipeline = Pipeline(self, streams, on_result=on_result, annotate=annotate)
+        self.pipeline.start()
+        self.running = True
+        if block:
+            try:
+                self.pipeline.wait()
+            finally:
+                self.running = False
+        return self.pipeline
+
+    def run_processes(self, source, on_result=None, block=True, annotate=True, workers=None, process_options=None):
+        # كل مصدر يُفك في عملية تكتب في حلقة ذاكرة مشتركة، والكشف والتتبع والتنبيهات في عمليات العمال
+        sources = list(source) if isinstance(source, (list, tuple)) else [source]
+        if on_result is not None and annotate:
+            buffers = {}
+            callback = on_result
+
+            def on_result(packet):
+                name = packet['stream']
+                buffers[name] = packet['display_frame'] = self.draw_annotations(
+                    packet['frame'], packet['tracked_objects'], packet['behaviors'], out=buffers.get(name))
+                callback(packet)
+
+        self.pipeline = ProcessPipeline(sources, self.options, workers=workers, on_result=on_result,
+                                        metrics=self.metrics, **(process_options or {}))
+        self.pipeline.start()
+        self.running = True
+        if block:
+            self.pipeline.wait()
+            self.running = False
+        return self.pipeline
+
+    def build_detection_cache(self, source, cache_dir='detection_cache', batch_size=16):
+        # تشغيل النموذج على كل إطار مرة واحدة وحفظ النتائج بشكل أعمدة على القرص
+        cap = cv2.VideoCapture(source)
+        if not cap.isOpened():
+            cap.release()
+            raise IOError(f"Cannot open video source: {source}")
+
+        path = DetectionCache.path_for(cache_dir, source, self.model_name)
+        writer = DetectionCacheWriter(path, {
+            'source': os.path.abspath(source),
+            'model': self.model_name,
+            'fps': cap.get(cv2.CAP_PROP_FPS),
+            'width': int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            'height': int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        })
+        print(f"بناء ذاكرة الكشف: {source}")
+        try:
+            batch = []
+            while True:
+                ret, frame = cap.read()
+                if ret:
+                    batch.append(frame)
+                if batch and (not ret or len(batch) == batch_size):
+                    for detections in self.detect_batch(batch):
+                        writer.append(detections)
+                    batch = []
+                if not ret:
+                    break
+        finally:
+            cap.release()
+        return writer.close()
+
+    def load_detection_cache(self, source, cache_dir='detection_cache'):
+        path = DetectionCache.path_for(cache_dir, source, self.model_name)
+        if DetectionCache.exists(path):
+            return DetectionCache(path)
+        return self.build_detection_cache(source, cache_dir)
+
+    def replay(self, source, on_result=None, cache_dir='detection_cache', behavior_detector=None,
+               with_frames=False):
+        # إعادة تشغيل المتتبع وقواعد السلوك من ذاكرة الكشف دون تشغيل YOLO
+        # بدون الإطارات يُتخطى كشف الحريق، ومع with_frames يُفك الفيديو بالتوازي مع الذاكرة
+        cache = self.load_detection_cache(source, cache_dir)
+        behavior_detector = behavior_detector or BehaviorDetector(**self.behavior_options, zones=self.zone_layout)
+        stream = CameraStream('replay', source, self.create_tracker(), behavior_detector, None,
+                              self.create_scheduler())
+        if with_frames:
+            stream.open()
+
+        events = []
+        start = time.perf_counter()
+        try:
+            for index in range(len(cache)):
+                frame = None
+                if with_frames:
+                    item = stream.capture.read()
+                    if item is None:
+                        break
+                    frame = item[1]
+                motion = None if frame is not None else 0.0
+                detections = cache[index] if stream.scheduler.should_detect(frame, motion) else None
+                tracked_objects = stream.track(detections)
+                timestamp = index / cache.meta['fps'] if cache.meta.get('fps') else None
+                behaviors = behavior_detector.detect_behaviors(tracked_objects, frame, timestamp)
+                stream.scheduler.observe(tracked_objects, behaviors)
+
+                stream.stats['frames'] += 1
+                for behavior in behaviors:
+                    stream.stats['alerts'] += 1
+                    if behavior['type'] in stream.stats['behavior_counts']:
+                        stream.stats['behavior_counts'][behavior['type']] += 1
+                    events.append(dict(behavior, frame=index))
+
+                if on_result is not None:
+                    on_result({'stream': stream.name, 'index': index, 'frame': frame, 'detections': detections,
+                               'tracked_objects': tracked_objects, 'behaviors': behaviors})
+        finally:
+            if stream.capture is not None:
+                stream.capture.release()
+
+        elapsed = time.perf_counter() - start
+        return dict(stream.stats, events=events, elapsed=elapsed,
+                    fps=stream.stats['frames'] / elapsed if elapsed > 0 else 0.0)
+
+    @staticmethod
+    def extract_detections(results):
         detections = []
         for result in results:
             boxes = result.boxes
@@ -33,8 +313,12 @@ class MoraqabSystem:
                     })
         return detections
 
-    def draw_annotations(self, frame, tracked_objects, behaviors):
-        display_frame = frame.copy()
+    def draw_annotations(self, frame, tracked_objects, behaviors, out=None):
+        # الرسم في مخزن يعيد المستدعي تمريره كل إطار، أو على الإطار نفسه إذا مُرر out=frame
+        if out is None or out.shape != frame.shape:
+            out = np.empty_like(frame)
+        if out is not frame:
+            np.copyto(out, frame)
 
         for obj in tracked_objects:
             x1, y1, x2, y2 = obj['bbox']
@@ -44,24 +328,65 @@ class MoraqabSystem:
             if obj['class'] == 0:   # 0 = person
                 color = (255, 0, 0)
 
-            cv2.rectangle(display_frame, (x1, y1), (x2, y2), color, 2)
-            cv2.circle(display_frame, (cx, cy), 5, color, -1)
-            cv2.putText(display_frame, f"ID:{obj['id']}",
+            cv2.rectangle(out, (x1, y1), (x2, y2), color, 2)
+            cv2.circle(out, (cx, cy), 5, color, -1)
+            cv2.putText(out, f"ID:{obj['id']}",
                         (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
 
         for i, behavior in enumerate(behaviors):
             y_pos = 30 + (i * 30)
-            behavior_names = {
-                'fighting': 'شجار',
-                'fire': 'حريق',
-                'fall': 'سقوط',
-                'crowd': 'تجمع'
-            }
-            text = f"{behavior_names.get(behavior['type'], behavior['type'])}"
-            cv2.putText(display_frame, text, (10, y_pos),
+            text = f"{self.behavior_names.get(behavior['type'], behavior['type'])}"
+            cv2.putText(out, text, (10, y_pos),
                         cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
 
-        return display_frame
+        return out
 
     def stop(self):
         self.running = False
+        if self.pipeline is not None:
+            self.pipeline.stop()
+            # المقاطع الجارية تُكتب وتُسجل قبل حفظ سجل الأحداث
+            self.pipeline.join()
+        if self.event_store is not None:
+            self.event_store.flush()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+            self.metrics_server = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="نظام مرقاب")
+    parser.add_argument('sources', nargs='+', help="مصدر الفيديو أو الكاميرا، ويمكن تمرير أكثر من مصدر")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="عدد عمليات المعالجة بذاكرة مشتركة (0 = خيوط داخل عملية واحدة)")
+    parser.add_argument('--record', action='store_true',
+                        help="تسجيل مستمر في مقاطع متتالية، ومقاطع التنبيهات تشير إليها بدل إعادة الترميز")
+    parser.add_argument('--segment-seconds', type=float, default=10)
+    parser.add_argument('--retention-minutes', type=float, default=60)
+    parser.add_argument('--clip-mode', choices=['reference', 'concat'], default='reference',
+                        help="concat يدمج المقاطع بنسخ التدفق (يحتاج ffmpeg)")
+    parser.add_argument('--no-sound', action='store_true', help="تعطيل صوت التنبيه (الخوادم بلا بطاقة صوت)")
+    args = parser.parse_args()
+
+    alert_options = {'sound': None} if args.no_sound else {}
+    if args.record:
+        alert_options['recording'] = {'segment_seconds': args.segment_seconds,
+                                      'retention_seconds': args.retention_minutes * 60,
+                                      'clip_mode': args.clip_mode}
+    system = MoraqabSystem(alert_options=alert_options)
+
+    def on_result(result):
+        for behavior in result['behaviors']:
+            print(f"[{result['stream']}:{result['index']}] {behavior['type']} ({behavior['severity']}): {behavior.get('details', '')}")
+
+    try:
+        sources = args.sources
+        # وضع بدون واجهة: لا حاجة لرسم الإطارات
+        system.run(sources if len(sources) > 1 else sources[0], on_result=on_result, annotate=False,
+                   workers=args.workers)
+    except KeyboardInterrupt:
+        system.stop()
+
+
+if __name__ == "__main__":
+    main()
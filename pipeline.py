@@ -0,0 +1,359 @@
+import threading
+import time
+from collections import deque
+
+from video_source import VideoSource, is_live_source
+
+
+class DropOldestQueue:
+    def __init__(self, maxsize, on_put=None):
+        self.maxsize = maxsize
+        self.dropped = 0
+        self.on_put = on_put
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def put(self, item, droppable=True, block=False):
+        # الحد صارم: إذا امتلأ الطابور بإطارات لا تُحذف، يُسقط الإطار الجديد القابل للحذف،
+        # وينتظر الإطار الذي يحمل تنبيهاً حتى يتوفر مكان
+        with self._cond:
+            while not self._closed and len(self._items) >= self.maxsize:
+                if not block and self._drop_oldest():
+                    break
+                if droppable and not block:
+                    self.dropped += 1
+                    return
+                self._cond.wait()
+            if self._closed:
+                return
+            self._items.append((item, droppable))
+            self._cond.notify_all()
+        if self.on_put is not None:
+            self.on_put()
+
+    def get(self):
+        with self._cond:
+            while not self._items and not self._closed:
+                self._cond.wait()
+            return self._pop()
+
+    def get_nowait(self):
+        with self._cond:
+            return self._pop()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self.on_put is not None:
+            self.on_put()
+
+    @property
+    def finished(self):
+        return self._closed and not self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def _pop(self):
+        if not self._items:
+            return None
+        item, _ = self._items.popleft()
+        self._cond.notify_all()
+        return item
+
+    def _drop_oldest(self):
+        # الإطارات التي تحمل تنبيهات لا تُحذف أبداً
+        for i, (_, droppable) in enumerate(self._items):
+            if droppable:
+                del self._items[i]
+                self.dropped += 1
+                return True
+        return False
+
+
+class CameraStream:
+    def __init__(self, name, source, tracker, behavior_detector, alert_system, scheduler, queue_size=4,
+                 zones=None, decode_options=None):
+        self.name = name
+        self.source = source
+        self.live = is_live_source(source)
+        self.tracker = tracker
+        self.behavior_detector = behavior_detector
+        self.alert_system = alert_system
+        self.scheduler = scheduler
+        self.zones = zones
+        self.decode_options = decode_options or {}
+
+        # البث المباشر ينتظر مكاناً واحداً فقط، فيُطلب من الكاميرا أحدث إطار عند الحاجة إليه
+        self.inference_queue = DropOldestQueue(1 if self.live else queue_size)
+        self.behavior_queue = DropOldestQueue(queue_size)
+        self.alert_queue = DropOldestQueue(queue_size * 8)
+
+        self.stats = {
+            'frames': 0,
+            'alerts': 0,
+            'skipped': 0,
+            'behavior_counts': {'fighting': 0, 'fire': 0, 'fall': 0, 'crowd': 0}
+        }
+        self.capture = None
+        self.fps = 0.0
+
+    def open(self):
+        self.capture = VideoSource(self.source, live=self.live, **self.decode_options).open()
+        self.set_fps(self.capture.fps)
+
+    def set_fps(self, fps):
+        # التسجيل المستمر يُفتح بمعدل إطارات المصدر الفعلي
+        self.fps = fps
+        if self.alert_system is not None:
+            self.alert_system.open_recorder(fps)
+
+    def media_time(self, packet):
+        # زمن الإطار داخل الملف (يبقى صحيحاً مع أخذ العينات والمعالجة أسرع من الزمن الحقيقي)،
+        # ووقت الالتقاط للبث المباشر
+        if not self.live and self.fps > 0:
+            return packet['index'] / self.fps
+        return packet['timestamp']
+
+    def track(self, detections):
+        if detections is None:
+            return self.tracker.predict()
+        tracked_objects = self.tracker.update(detections)
+        self.behavior_detector.remove_tracks(self.tracker.removed_ids)
+        return tracked_objects
+
+    def queues(self):
+        return (self.inference_queue, self.behavior_queue, self.alert_queue)
+
+    def register_metrics(self, metrics):
+        for queue_name, q in zip(('inference', 'behavior', 'alert'), self.queues()):
+            metrics.set_gauge('queue_depth', q.__len__, stream=self.name, queue=queue_name)
+            metrics.set_gauge('queue_dropped', lambda q=q: q.dropped, stream=self.name, queue=queue_name)
+        metrics.set_gauge('alerts_dropped', lambda: self.alert_system.dropped_alerts, stream=self.name)
+        metrics.set_gauge('alert_frames_dropped', lambda: self.alert_system.video_buffer.dropped_frames,
+                          stream=self.name)
+        metrics.set_gauge('detection_interval', lambda: self.scheduler.current_interval, stream=self.name)
+        metrics.set_gauge('frames_skipped', lambda: self.scheduler.skipped, stream=self.name)
+        metrics.set_gauge('decode_skipped', lambda: self.capture.skipped, stream=self.name)
+
+
+class Pipeline:
+    def __init__(self, system, streams, on_result=None, annotate=True, max_batch_size=16):
+        self.system = system
+        self.streams = streams
+        self.on_result = on_result
+        self.annotate = annotate and on_result is not None
+        self.max_batch_size = max_batch_size
+
+        self.output_queue = DropOldestQueue(2 * len(streams))
+        self.running = False
+        self.error = None
+        self._frame_ready = threading.Event()
+        self._threads = []
+
+        for stream in streams:
+            stream.inference_queue.on_put = self._frame_ready.set
+
+    @property
+    def stats(self):
+        if len(self.streams) == 1:
+            return self.streams[0].stats
+        return {stream.name: stream.stats for stream in self.streams}
+
+    def start(self):
+        opened = []
+        try:
+            for stream in self.streams:
+                stream.open()
+                opened.append(stream)
+        except IOError:
+            for stream in opened:
+                stream.capture.release()
+            raise
+
+        for stream in self.streams:
+            stream.register_metrics(self.system.metrics)
+
+        self.running = True
+        behavior_threads = []
+        self._spawn(self._inference_worker, (), [stream.behavior_queue for stream in self.streams])
+        for stream in self.streams:
+            self._spawn(self._capture_worker, (stream,), [stream.inference_queue])
+            behavior_threads.append(self._spawn(self._behavior_worker, (stream,), [stream.alert_queue]))
+            self._spawn(self._alert_worker, (stream,), [])
+        if self.on_result is not None:
+            self._spawn(self._output_worker, (), [])
+
+        closer = threading.Thread(target=self._close_output, args=(behavior_threads,), daemon=True)
+        closer.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        for stream in self.streams:
+            for q in stream.queues():
+                q.close()
+        self.output_queue.close()
+
+    def wait(self):
+        self.join()
+        if self.error is not None:
+            raise self.error
+
+    def join(self):
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join()
+
+    def _spawn(self, target, args, outputs):
+        thread = threading.Thread(target=self._run_stage, args=(target, args, outputs), daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        return thread
+
+    def _run_stage(self, target, args, outputs):
+        # خطأ في أي مرحلة يغلق كل الطوابير حتى لا تبقى المراحل الأخرى منتظرة، ويُعاد رفعه من wait()
+        try:
+            target(*args)
+        except Exception as e:
+            if self.error is None:
+                self.error = e
+            self.stop()
+        finally:
+            for q in outputs:
+                q.close()
+
+    def _close_output(self, behavior_threads):
+        for thread in behavior_threads:
+            thread.join()
+        self.output_queue.close()
+
+    def _capture_worker(self, stream):
+        metrics = self.system.metrics
+        try:
+            while self.running:
+                # الفك يجري في خيط VideoSource، وهنا يُقاس الانتظار عليه فقط
+                start = time.perf_counter()
+                item = stream.capture.read()
+                if item is None:
+                    break
+                metrics.observe('decode', time.perf_counter() - start, stream.name)
+                index, frame = item
+                packet = {'stream': stream.name, 'index': index, 'frame': frame, 'timestamp': time.time()}
+                # لا إسقاط هنا: البث المباشر لا يُفك منه إلا ما سيُعالج فعلاً
+                stream.inference_queue.put(packet, block=True)
+        finally:
+            stream.capture.release()
+
+    def _inference_worker(self):
+        pending = list(self.streams)
+        while pending:
+            self._frame_ready.wait()
+            self._frame_ready.clear()
+
+            # نجمع أحدث إطار متاح من كل كاميرا في دفعة واحدة للنموذج
+            batch = []
+            for stream in pending:
+                packet = stream.inference_queue.get_nowait()
+                if packet is not None:
+                    batch.append((stream, packet))
+                    if len(stream.inference_queue):
+                        self._frame_ready.set()
+            pending = [stream for stream in pending if not stream.inference_queue.finished]
+            if not batch:
+                continue
+
+            for stream, packet in batch:
+                packet['static'] = stream.scheduler.is_static(packet['frame'])
+            to_detect = [(stream, packet) for stream, packet in batch
+                         if not packet['static'] and stream.scheduler.should_detect(packet['frame'])]
+            for start in range(0, len(to_detect), self.max_batch_size):
+                chunk = to_detect[start:start + self.max_batch_size]
+                detections = self.system.detect_batch([packet['frame'] for _, packet in chunk],
+                                                      [stream.zones for stream, _ in chunk])
+                for (_, packet), dets in zip(chunk, detections):
+                    packet['detections'] = dets
+
+            for stream, packet in batch:
+                packet.setdefault('detections', None)
+                stream.behavior_queue.put(packet, block=not stream.live)
+
+    def _behavior_worker(self, stream):
+        metrics = self.system.metrics
+        stats = stream.stats
+        while True:
+            packet = stream.behavior_queue.get()
+            if packet is None:
+                break
+
+            frame = packet['frame']
+            if packet['static']:
+                # لا شيء تغير: المسارات تتقدم في العمر فقط، ولا تُقيّم قواعد السلوك
+                tracked_objects = stream.tracker.age()
+                behaviors = []
+                stats['skipped'] += 1
+            else:
+                start = time.perf_counter()
+                tracked_objects = stream.track(packet['detections'])
+                metrics.observe('track', time.perf_counter() - start, stream.name)
+
+                start = time.perf_counter()
+                behaviors = stream.behavior_detector.detect_behaviors(tracked_objects, frame,
+                                                                      stream.media_time(packet))
+                metrics.observe('detect_behaviors', time.perf_counter() - start, stream.name)
+                stream.scheduler.observe(tracked_objects, behaviors)
+            metrics.inc('frames', stream=stream.name)
+            if behaviors:
+                metrics.inc('alerts', len(behaviors), stream=stream.name)
+
+            stats['frames'] += 1
+            for behavior in behaviors:
+                stats['alerts'] += 1
+                if behavior['type'] in stats['behavior_counts']:
+                    stats['behavior_counts'][behavior['type']] += 1
+
+            packet['tracked_objects'] = tracked_objects
+            packet['behaviors'] = behaviors
+            stream.alert_queue.put(packet, droppable=not behaviors)
+
+            if self.on_result is not None:
+                packet['stats'] = {
+                    'frames': stats['frames'],
+                    'alerts': stats['alerts'],
+                    'skipped': stats['skipped'],
+                    'behavior_counts': dict(stats['behavior_counts'])
+                }
+                self.output_queue.put(packet, droppable=not behaviors)
+
+    def _alert_worker(self, stream):
+        metrics = self.system.metrics
+        while True:
+            packet = stream.alert_queue.get()
+            if packet is None:
+                break
+            start = time.perf_counter()
+            stream.alert_system.add_frame_to_buffer(packet['frame'], stream.media_time(packet))
+            for behavior in packet['behaviors']:
+                stream.alert_system.trigger_alert(behavior, packet['frame'])
+            metrics.observe('alert', time.perf_counter() - start, stream.name)
+        # المرحلة لا تنتهي قبل كتابة كل المقاطع، فيكتمل سجل الأحداث عند عودة run()
+        stream.alert_system.close()
+
+    def _output_worker(self):
+        # الرسم هنا فقط للإطارات التي تصل فعلاً إلى on_result، في مخزن ثابت لكل كاميرا
+        # display_frame صالح أثناء استدعاء on_result فقط، ومن يحتفظ به عليه نسخه
+        metrics = self.system.metrics
+        buffers = {}
+        while True:
+            packet = self.output_queue.get()
+            if packet is None:
+                break
+            if self.annotate:
+                start = time.perf_counter()
+                name = packet['stream']
+                buffers[name] = packet['display_frame'] = self.system.draw_annotations(
+                    packet['frame'], packet['tracked_objects'], packet['behaviors'], out=buffers.get(name))
+                metrics.observe('annotate', time.perf_counter() - start, name)
+            self.on_result(packet)
@@ -0,0 +1,473 @@
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+from multiprocessing.connection import wait as wait_connections
+
+import cv2
+import numpy as np
+
+from metrics import Metrics
+from video_source import VideoSource
+
+# رأس الحلقة: المكتوب، وما أخذه العامل، وأول إطار لم يُحرر، وما تخطاه الفك دون فكه، وعلما الإيقاف ونهاية المصدر
+WRITTEN, CLAIMED, RELEASED, DROPPED, STOP, EOF = range(6)
+HEADER_BYTES = 64
+
+
+class FrameRing:
+    # حلقة إطارات في ذاكرة مشتركة: يكتب فيها المفكك مباشرة، ويقرأ العمال منها بلا نسخ ولا pickle
+    # التنسيق كله عبر عدادات الرأس، فلا أقفال مشتركة يمكن أن تبقى مقفلة إذا انهارت عملية
+    def __init__(self, shape, slots, name=None):
+        self.shape = tuple(shape)
+        self.slots = slots
+        frame_bytes = int(np.prod(self.shape))
+        create = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=create,
+                                              size=HEADER_BYTES + slots * (16 + frame_bytes))
+        self.header = np.ndarray((HEADER_BYTES // 8,), dtype=np.int64, buffer=self.shm.buf)
+        # لكل مكان: وقت الالتقاط ورقم الإطار في المصدر (قد يقفز مع أخذ العينات)
+        self.times = np.ndarray((slots,), dtype=np.float64, buffer=self.shm.buf, offset=HEADER_BYTES)
+        self.positions = np.ndarray((slots,), dtype=np.int64, buffer=self.shm.buf,
+                                    offset=HEADER_BYTES + slots * 8)
+        self.frames = np.ndarray((slots,) + self.shape, dtype=np.uint8, buffer=self.shm.buf,
+                                 offset=HEADER_BYTES + slots * 16)
+        if create:
+            self.header[:] = 0
+
+    @property
+    def spec(self):
+        return {'name': self.shm.name, 'shape': self.shape, 'slots': self.slots}
+
+    @classmethod
+    def attach(cls, spec):
+        return cls(spec['shape'], spec['slots'], spec['name'])
+
+    def slot(self, index):
+        return self.frames[index % self.slots]
+
+    def timestamp(self, index):
+        return float(self.times[index % self.slots])
+
+    def position(self, index):
+        return int(self.positions[index % self.slots])
+
+    def write(self, index, position, frame):
+        slot = self.slot(index)
+        if frame.shape == slot.shape:
+            np.copyto(slot, frame)
+        else:
+            # تغير مقاس البث: نعيده لمقاس الحلقة
+            cv2.resize(frame, (self.shape[1], self.shape[0]), dst=slot)
+        self.times[index % self.slots] = time.time()
+        self.positions[index % self.slots] = position
+        self.header[WRITTEN] = index + 1
+
+    @property
+    def pending(self):
+        return int(self.header[WRITTEN] - self.header[RELEASED])
+
+    def release(self, index):
+        # كل إطار لكاميرا يُعالج بالترتيب، فتحرير إطار يحرر كل ما قبله
+        if index + 1 > self.header[RELEASED]:
+            self.header[RELEASED] = index + 1
+
+    def close(self):
+        # نبقي نسخة من الرأس حتى تبقى العدادات مقروءة بعد تحرير الذاكرة
+        self.header = self.header.copy()
+        self.times = self.positions = self.frames = None
+        self.shm.close()
+
+
+def decoder_main(name, source, slots, info, decode_options, spec=None):
+    capture = VideoSource(source, **decode_options)
+    if spec is not None and not capture.live:
+        # إعادة تشغيل بعد انهيار: الملفات تُكمل بعد آخر إطار كُتب في الحلقة
+        ring = FrameRing.attach(spec)
+        written = int(ring.header[WRITTEN])
+        capture.seek_frame(int(ring.positions[(written - 1) % ring.slots]) + 1 if written else 0)
+        ring.close()
+    try:
+        capture.open()
+    except IOError as e:
+        info.put((name, None, str(e)))
+        return
+
+    if spec is None:
+        item = capture.read()
+        if item is None:
+            capture.release()
+            info.put((name, None, f"Cannot read video source: {source}"))
+            return
+        ring = FrameRing(item[1].shape, slots)
+        ring.write(0, *item)
+        info.put((name, ring.spec, capture.fps))
+    else:
+        ring = FrameRing.attach(spec)
+
+    parent = multiprocessing.parent_process()
+    try:
+        # لا نبقى يتامى إذا مات الأب دون أن يرفع علم الإيقاف
+        while not ring.header[STOP] and parent.is_alive():
+            index = int(ring.header[WRITTEN])
+            if index - ring.header[RELEASED] >= ring.slots:
+                # الحلقة ممتلئة: لا نطلب إطاراً، والبث المباشر يتخطى ما يفوته دون فك
+                time.sleep(0.001)
+                continue
+            item = capture.read()
+            if item is None:
+                break
+            ring.write(index, *item)
+            ring.header[DROPPED] = capture.skipped
+        ring.header[EOF] = 1
+    finally:
+        capture.release()
+        ring.close()
+
+
+def claim_frames(ring, live, max_frames):
+    # EOF يُقرأ قبل WRITTEN حتى لا يفوتنا آخر إطار كُتب قبل علامة النهاية
+    eof = ring.header[EOF]
+    written, claimed = int(ring.header[WRITTEN]), int(ring.header[CLAIMED])
+    if claimed >= written:
+        return None if eof else []
+    # البث المباشر يعالج أحدث إطار فقط، والإطارات الأقدم تُحرر مع تحريره
+    indices = [written - 1] if live else list(range(claimed, min(written, claimed + max_frames)))
+    # يُعلّم الإطار قبل معالجته، فإطار يُسقط العامل لا يُعاد بعد إعادة تشغيله
+    ring.header[CLAIMED] = indices[-1] + 1
+    return indices
+
+
+def worker_main(worker_id, streams, options, results, threads, release, max_batch_size):
+    # كل عامل يحمل نموذجه ويملك حالة كاميراته (المتتبع وقواعد السلوك والتنبيهات) بالكامل
+    os.environ.setdefault('OMP_NUM_THREADS', str(threads))
+    cv2.setNumThreads(threads)
+    from moraqab_system import MoraqabSystem
+
+    system = MoraqabSystem(**options)
+    rings, cameras = {}, {}
+    for name, (source, spec, fps) in streams.items():
+        rings[name] = FrameRing.attach(spec)
+        cameras[name] = system.create_stream(source, name)
+        # المصدر يُفك في عملية أخرى، فمعدل إطاراته يأتي من الأب لحساب زمن كل إطار وللتسجيل المستمر
+        cameras[name].set_fps(fps)
+    active = list(streams)
+    parent = multiprocessing.parent_process()
+
+    while active:
+        batch = []
+        for name in list(active):
+            indices = claim_frames(rings[name], cameras[name].live, max_batch_size)
+            if indices is None:
+                active.remove(name)
+            else:
+                batch.extend((name, index) for index in indices)
+        if not batch:
+            # لا أحد يحرر الإطارات أو يجمع النتائج إذا مات الأب، فلا نبقى يتامى
+            if not parent.is_alive():
+                return
+            time.sleep(0.002)
+            continue
+
+        packets = []
+        for name, slot in batch:
+            ring = rings[name]
+            packet = {'stream': name, 'index': ring.position(slot), 'slot': slot, 'timestamp': ring.timestamp(slot),
+                      'frame': ring.slot(slot), 'detections': None, 'timings': {}}
+            scheduler = cameras[name].scheduler
+            packet['static'] = scheduler.is_static(packet['frame'])
+            packet['detect'] = not packet['static'] and scheduler.should_detect(packet['frame'])
+            packets.append(packet)
+
+        to_detect = [packet for packet in packets if packet.pop('detect')]
+        for start in range(0, len(to_detect), max_batch_size):
+            chunk = to_detect[start:start + max_batch_size]
+            began = time.perf_counter()
+            detections = system.detect_batch([packet['frame'] for packet in chunk],
+                                             [cameras[packet['stream']].zones for packet in chunk])
+            elapsed = (time.perf_counter() - began) / len(chunk)
+            for packet, dets in zip(chunk, detections):
+                packet['detections'] = dets
+                packet['timings']['inference'] = elapsed
+
+        for packet in packets:
+            process_packet(cameras[packet['stream']], packet)
+            del packet['frame'], packet['detections']
+            results.send(('result', packet))
+            if release:
+                rings[packet['stream']].release(packet['slot'])
+        del packet, packets, to_detect
+
+    for camera in cameras.values():
+        camera.alert_system.close()
+    if system.event_store is not None:
+        system.event_store.flush()
+    for ring in rings.values():
+        ring.close()
+    results.send(('done', worker_id))
+    results.close()
+
+
+def process_packet(camera, packet):
+    stats = camera.stats
+    frame = packet['frame']
+    timestamp = camera.media_time(packet)
+    if packet['static']:
+        tracked_objects = camera.tracker.age()
+        behaviors = []
+        stats['skipped'] += 1
+    else:
+        start = time.perf_counter()
+        tracked_objects = camera.track(packet['detections'])
+        packet['timings']['track'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        behaviors = camera.behavior_detector.detect_behaviors(tracked_objects, frame, timestamp)
+        packet['timings']['detect_behaviors'] = time.perf_counter() - start
+        camera.scheduler.observe(tracked_objects, behaviors)
+
+    start = time.perf_counter()
+    camera.alert_system.add_frame_to_buffer(frame, timestamp)
+    for behavior in behaviors:
+        camera.alert_system.trigger_alert(behavior, frame)
+    packet['timings']['alert'] = time.perf_counter() - start
+
+    stats['frames'] += 1
+    for behavior in behaviors:
+        stats['alerts'] += 1
+        if behavior['type'] in stats['behavior_counts']:
+            stats['behavior_counts'][behavior['type']] += 1
+
+    packet['tracked_objects'] = tracked_objects
+    packet['behaviors'] = behaviors
+    packet['stats'] = dict(stats, behavior_counts=dict(stats['behavior_counts']))
+
+
+def empty_stats():
+    return {'frames': 0, 'alerts': 0, 'skipped': 0,
+            'behavior_counts': {'fighting': 0, 'fire': 0, 'fall': 0, 'crowd': 0}}
+
+
+def add_stats(a, b):
+    counts = dict(a['behavior_counts'])
+    for behavior_type, count in b['behavior_counts'].items():
+        counts[behavior_type] = counts.get(behavior_type, 0) + count
+    return {'frames': a['frames'] + b['frames'], 'alerts': a['alerts'] + b['alerts'],
+            'skipped': a['skipped'] + b['skipped'], 'behavior_counts': counts}
+
+
+class ProcessPipeline:
+    def __init__(self, sources, options=None, workers=None, on_result=None, metrics=None, threads=1,
+                 ring_slots=8, max_batch_size=16, max_restarts=3, names=None, open_timeout=30.0):
+        self.sources = list(sources)
+        self.names = list(names) if names else [f"cam{i}" for i in range(len(self.sources))]
+        self.options = dict(options or {})
+        self.decode_options = self.options.get('decode_options') or {}
+        self.workers = max(1, min(workers or os.cpu_count() or 1, len(self.sources)))
+        self.on_result = on_result
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.threads = threads
+        self.ring_slots = ring_slots
+        self.max_batch_size = max_batch_size
+        self.max_restarts = max_restarts
+        self.open_timeout = open_timeout
+
+        self.running = False
+        self.restarts = 0
+        self.fps = {}
+        self.stream_stats = {name: empty_stats() for name in self.names}
+        self._base_stats = {name: empty_stats() for name in self.names}
+        self._last_stats = {}
+        self._context = multiprocessing.get_context('spawn')
+        # كل كاميرا مرتبطة بعامل ثابت حتى تبقى حالة تتبعها في عملية واحدة
+        self._assignment = {name: i % self.workers for i, name in enumerate(self.names)}
+        self._rings = {}
+        self._decoders = {}
+        self._worker_procs = {}
+        self._connections = {}
+        self._restart_counts = {}
+        self._finished_decoders = set()
+        self._done_workers = set()
+        self._lock = threading.Lock()
+        self._collector = None
+        self._supervisor = None
+
+    @property
+    def stats(self):
+        if len(self.names) == 1:
+            return self.stream_stats[self.names[0]]
+        return dict(self.stream_stats)
+
+    def start(self):
+        info = self._context.Queue()
+        for name, source in zip(self.names, self.sources):
+            self._decoders[name] = self._spawn(decoder_main, (name, source, self.ring_slots, info,
+                                                              self.decode_options))
+
+        errors = []
+        for _ in self.names:
+            try:
+                name, spec, detail = info.get(timeout=self.open_timeout)
+            except queue.Empty:
+                errors.append("Timed out opening video sources")
+                break
+            if spec is None:
+                errors.append(detail)
+            else:
+                self._rings[name] = FrameRing.attach(spec)
+                self.fps[name] = detail
+        if errors:
+            self._shutdown()
+            raise IOError("; ".join(errors))
+
+        for i in range(self.workers):
+            self._start_worker(i)
+        self._register_metrics()
+
+        self.running = True
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+        self._supervisor = threading.Thread(target=self._supervise, daemon=True)
+        self._supervisor.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        for ring in self._rings.values():
+            ring.header[STOP] = 1
+
+    def wait(self):
+        self.join()
+
+    def join(self):
+        if self._collector is not None and self._collector is not threading.current_thread():
+            self._collector.join()
+
+    def _spawn(self, target, args):
+        process = self._context.Process(target=target, args=args, daemon=True)
+        process.start()
+        return process
+
+    def _start_worker(self, i):
+        # أنبوب نتائج جديد لكل تشغيل للعامل: لا يشاركه أحد، فانهيار العامل لا يعطل البقية
+        streams = {name: (source, self._rings[name].spec, self.fps[name])
+                   for name, source in zip(self.names, self.sources) if self._assignment[name] == i}
+        reader, writer = self._context.Pipe(duplex=False)
+        process = self._spawn(worker_main, (i, streams, self.options, writer, self.threads,
+                                            self.on_result is None, self.max_batch_size))
+        writer.close()
+        with self._lock:
+            self._worker_procs[i] = process
+            self._connections[i] = reader
+
+    def _register_metrics(self):
+        for name, ring in self._rings.items():
+            self.metrics.set_gauge('ring_pending', lambda ring=ring: ring.pending, stream=name)
+            self.metrics.set_gauge('decode_skipped', lambda ring=ring: int(ring.header[DROPPED]), stream=name)
+        self.metrics.set_gauge('process_restarts', lambda: self.restarts)
+
+    def _collect(self):
+        try:
+            while len(self._done_workers) < self.workers:
+                with self._lock:
+                    connections = {conn: i for i, conn in self._connections.items()}
+                ready = wait_connections(list(connections), timeout=0.5)
+                if not ready and not self.running and not any(p.is_alive() for p in self._worker_procs.values()):
+                    break
+                for conn in ready:
+                    try:
+                        kind, payload = conn.recv()
+                    except (EOFError, OSError):
+                        # العامل انتهى أو انهار، والمشرف يقرر إعادة تشغيله
+                        with self._lock:
+                            if self._connections.get(connections[conn]) is conn:
+                                del self._connections[connections[conn]]
+                        conn.close()
+                        continue
+                    if kind == 'done':
+                        self._done_workers.add(payload)
+                    else:
+                        self._handle_result(payload)
+        finally:
+            self.running = False
+            self._shutdown()
+
+    def _handle_result(self, packet):
+        name = packet['stream']
+        for stage, seconds in packet.pop('timings').items():
+            self.metrics.observe(stage, seconds, name)
+        self.metrics.inc('frames', stream=name)
+        if packet['behaviors']:
+            self.metrics.inc('alerts', len(packet['behaviors']), stream=name)
+        self._update_stats(name, packet)
+
+        if self.on_result is not None:
+            # نسخة خاصة بالمستدعي، ثم يُحرر مكان الإطار في الحلقة فوراً
+            ring = self._rings[name]
+            packet['frame'] = ring.slot(packet['slot']).copy()
+            ring.release(packet['slot'])
+            self.on_result(packet)
+
+    def _update_stats(self, name, packet):
+        # عدادات العامل تبدأ من الصفر بعد إعادة تشغيله، فنضيف إليها ما سبق الانهيار
+        worker_stats = packet['stats']
+        last = self._last_stats.get(name)
+        if last is not None and worker_stats['frames'] < last['frames']:
+            self._base_stats[name] = add_stats(self._base_stats[name], last)
+        self._last_stats[name] = worker_stats
+        self.stream_stats[name] = packet['stats'] = add_stats(self._base_stats[name], worker_stats)
+
+    def _supervise(self):
+        while self.running:
+            time.sleep(0.5)
+            for name, process in list(self._decoders.items()):
+                if process.is_alive() or process.exitcode == 0 or name in self._finished_decoders:
+                    continue
+                if not self._can_restart(('decoder', name)):
+                    # المفكك انهار نهائياً: نعلّم نهاية المصدر حتى ينهي العامل ما بقي
+                    print(f"توقف مفكك {name} نهائياً (رمز الخروج {process.exitcode})")
+                    self._finished_decoders.add(name)
+                    self._rings[name].header[EOF] = 1
+                    continue
+                print(f"إعادة تشغيل مفكك {name} (رمز الخروج {process.exitcode})")
+                source = self.sources[self.names.index(name)]
+                self._decoders[name] = self._spawn(decoder_main, (name, source, self.ring_slots, self._context.Queue(),
+                                                                  self.decode_options, self._rings[name].spec))
+
+            for i, process in list(self._worker_procs.items()):
+                if process.is_alive() or process.exitcode == 0 or i in self._done_workers:
+                    continue
+                if not self._can_restart(('worker', i)):
+                    print(f"توقف العامل {i} نهائياً (رمز الخروج {process.exitcode})")
+                    for name, worker in self._assignment.items():
+                        if worker == i:
+                            self._rings[name].header[STOP] = 1
+                    self._done_workers.add(i)
+                    continue
+                print(f"إعادة تشغيل العامل {i} (رمز الخروج {process.exitcode})")
+                self._start_worker(i)
+
+    def _can_restart(self, key):
+        count = self._restart_counts.get(key, 0)
+        if count >= self.max_restarts:
+            return False
+        self._restart_counts[key] = count + 1
+        self.restarts += 1
+        return True
+
+    def _shutdown(self):
+        for ring in self._rings.values():
+            ring.header[STOP] = 1
+        for process in list(self._decoders.values()) + list(self._worker_procs.values()):
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        for ring in self._rings.values():
+            ring.close()
+            try:
+                ring.shm.unlink()
+            except FileNotFoundError:
+                pass
+        self._rings = {}
@@ -0,0 +1,109 @@
+import cv2
+import numpy as np
+
+
+class DetectionScheduler:
+    def __init__(self, interval=1, adaptive=False, min_interval=1, motion_threshold=6.0,
+                 max_quiet_tracks=8, alert_hold_frames=60, motion_size=(160, 90), motion_gate=False,
+                 gate_threshold=0.002, pixel_threshold=15, gate_hold_frames=15):
+        self.interval = max(1, interval)
+        self.adaptive = adaptive
+        self.min_interval = max(1, min_interval)
+        self.motion_threshold = motion_threshold
+        self.max_quiet_tracks = max_quiet_tracks
+        self.alert_hold_frames = alert_hold_frames
+        self.motion_size = motion_size
+
+        # بوابة الحركة: نسبة البكسلات المتغيرة (أكثر من pixel_threshold) مقارنة بآخر إطار غير ساكن
+        self.motion_gate = motion_gate
+        self.gate_threshold = gate_threshold
+        self.pixel_threshold = pixel_threshold
+        self.gate_hold_frames = gate_hold_frames
+
+        self.frames = 0
+        self.detections = 0
+        self.skipped = 0
+        self.motion = 0.0
+        self.changed = 0.0
+        self.track_count = 0
+        self._since_detection = None
+        self._alert_frames = 0
+        self._hold = 0
+        self._gated_motion = None
+        self._small = np.empty((motion_size[1], motion_size[0], 3), dtype=np.uint8)
+        self._gray = np.empty((motion_size[1], motion_size[0]), dtype=np.uint8)
+        self._diff = np.empty_like(self._gray)
+        self._prev_gray = None
+        self._reference = None
+
+    @property
+    def current_interval(self):
+        if self.adaptive and self.busy:
+            return self.min_interval
+        return self.interval
+
+    @property
+    def busy(self):
+        # أي حركة أو ازدحام أو تنبيه نشط يعيد الكشف إلى كل إطار
+        return (self.motion > self.motion_threshold
+                or self.track_count > self.max_quiet_tracks
+                or self._alert_frames > 0)
+
+    def is_static(self, frame):
+        # الإطار الساكن يتخطى النموذج وقواعد السلوك، مع مهلة بعد آخر حركة حتى تستقر المسارات
+        if not self.motion_gate or frame is None:
+            return False
+
+        self._gated_motion = self._measure_motion(frame)
+        if self._reference is None:
+            self._reference = self._gray.copy()
+            return False
+
+        cv2.absdiff(self._prev_gray, self._reference, dst=self._diff)
+        cv2.threshold(self._diff, self.pixel_threshold, 255, cv2.THRESH_BINARY, dst=self._diff)
+        self.changed = cv2.countNonZero(self._diff) / self._diff.size
+
+        if self.changed > self.gate_threshold or self._alert_frames > 0:
+            self._hold = self.gate_hold_frames
+        elif self._hold > 0:
+            self._hold -= 1
+        else:
+            self.skipped += 1
+            return True
+
+        np.copyto(self._reference, self._prev_gray)
+        return False
+
+    def should_detect(self, frame, motion=None):
+        self.frames += 1
+        if self.adaptive:
+            if motion is None and self._gated_motion is not None:
+                # نفس قياس الحركة الذي حسبته بوابة الحركة لهذا الإطار
+                motion = self._gated_motion
+            self.motion = self._measure_motion(frame) if motion is None else motion
+        self._gated_motion = None
+
+        if self._since_detection is None or self._since_detection + 1 >= self.current_interval:
+            self._since_detection = 0
+            self.detections += 1
+            return True
+
+        self._since_detection += 1
+        return False
+
+    def observe(self, tracked_objects, behaviors):
+        self.track_count = len(tracked_objects)
+        if behaviors:
+            self._alert_frames = self.alert_hold_frames
+        elif self._alert_frames > 0:
+            self._alert_frames -= 1
+
+    def _measure_motion(self, frame):
+        cv2.resize(frame, self.motion_size, dst=self._small, interpolation=cv2.INTER_LINEAR)
+        cv2.cvtColor(self._small, cv2.COLOR_BGR2GRAY, dst=self._gray)
+        if self._prev_gray is None:
+            self._prev_gray = self._gray.copy()
+            return 0.0
+        motion = cv2.norm(self._gray, self._prev_gray, cv2.NORM_L1) / self._gray.size
+        self._gray, self._prev_gray = self._prev_gray, self._gray
+        return motion
@@ -0,0 +1,200 @@
+import glob
+import json
+import os
+import queue
+import shutil
+import subprocess
+import threading
+import time
+
+import cv2
+
+
+class Segment:
+    def __init__(self, path, start_frame, start_time):
+        self.path = path
+        self.start_frame = start_frame
+        self.end_frame = start_frame
+        self.start_time = start_time
+        self.end_time = start_time
+
+
+class SegmentRecorder:
+    # تسجيل مستمر لكل كاميرا في مقاطع قصيرة متتالية، تُحذف بعد retention_seconds
+    # الترميز يحدث مرة واحدة لكل إطار في خيط خلفي، والتنبيهات تشير إلى المقاطع بدل إعادة ترميزها
+    def __init__(self, directory, fps=30, segment_seconds=10, retention_seconds=3600, fourcc='mp4v',
+                 queue_size=64):
+        self.directory = directory
+        self.fps = fps
+        self.segment_frames = max(1, int(round(segment_seconds * fps)))
+        self.retention_seconds = retention_seconds
+        self.fourcc = fourcc
+        self.frames = 0
+        self.closed_segments = []
+        # زمن المصدر لأول إطار: موضع كل إطار في التسجيل يُحسب من زمنه لا من ترتيبه
+        self._origin = None
+        self.on_segment_closed = []
+
+        os.makedirs(directory, exist_ok=True)
+        # مقاطع التشغيلات السابقة تدخل في حساب الاحتفاظ فقط
+        self._old_files = sorted(glob.glob(os.path.join(directory, 'seg_*.mp4')))
+        self._current = None
+        self._writer = None
+        self._next_frame = 0
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, name=f"recorder-{directory}", daemon=True)
+        self._thread.start()
+
+    def write(self, frame, timestamp=None):
+        # timestamp زمن الإطار في الملف أو وقت التقاطه من البث. الإطارات التي لم تصل (أخذ عينات،
+        # تخطي البث المباشر، إسقاط تحت الضغط) تُملأ فجوتها بتكرار الإطار الذي يليها حتى يبقى التسجيل بمعدل fps ثابت
+        # وتطابق مدته الزمن الحقيقي، والفجوة الطويلة (توقف المصدر) لا تُملأ بأكثر من مقطع واحد
+        if timestamp is None:
+            timestamp = time.time()
+        if self._origin is None or (timestamp - self._origin) * self.fps < self.frames - 1:
+            # أول إطار، أو رجوع الزمن (ملف جديد أو قفز للخلف): الإطار يُكتب في الموضع التالي مباشرة
+            self._origin = timestamp - self.frames / self.fps
+        target = int(round((timestamp - self._origin) * self.fps)) + 1
+        count = min(max(1, target - self.frames), self.segment_frames)
+        if count < target - self.frames:
+            self._origin = timestamp - (self.frames + count - 1) / self.fps
+        # نسخة لأن المستدعي قد يعيد استخدام الإطار (حلقة الذاكرة المشتركة)
+        self._queue.put((frame.copy(), count))
+        self.frames += count
+
+    def flush(self):
+        # إغلاق المقطع الحالي حتى تكتمل التنبيهات التي تنتظر ما بعد الحدث
+        self._queue.put(('close', None))
+        self._queue.join()
+
+    def close(self):
+        self.flush()
+        self._queue.put((None, None))
+        self._thread.join()
+
+    def segments(self, start_frame, end_frame):
+        with self._lock:
+            return [segment for segment in self.closed_segments
+                    if segment.end_frame > start_frame and segment.start_frame < end_frame]
+
+    def _run(self):
+        while True:
+            frame, count = self._queue.get()
+            try:
+                if frame is None:
+                    self._close_segment()
+                    return
+                if isinstance(frame, str):
+                    self._close_segment()
+                    continue
+                for _ in range(count):
+                    if self._current is not None and \
+                            self._current.end_frame - self._current.start_frame >= self.segment_frames:
+                        self._close_segment()
+                    if self._current is None:
+                        self._open_segment(frame)
+                    self._writer.write(frame)
+                    self._current.end_frame += 1
+                    self._next_frame += 1
+                self._current.end_time = time.time()
+            finally:
+                self._queue.task_done()
+
+    def _open_segment(self, frame):
+        # أسماء المقاطع والاحتفاظ بوقت الساعة، فزمن المصدر يبدأ من الصفر في كل ملف
+        timestamp = time.time()
+        path = os.path.join(self.directory, f"seg_{int(timestamp * 1000)}_{self._next_frame}.mp4")
+        height, width = frame.shape[:2]
+        self._writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*self.fourcc), self.fps, (width, height))
+        self._current = Segment(path, self._next_frame, timestamp)
+
+    def _close_segment(self):
+        if self._current is None:
+            return
+        self._writer.release()
+        segment, self._current, self._writer = self._current, None, None
+        with self._lock:
+            self.closed_segments.append(segment)
+        self._enforce_retention()
+        for callback in self.on_segment_closed:
+            callback(segment)
+
+    def _enforce_retention(self):
+        if self.retention_seconds is None:
+            return
+        cutoff = time.time() - self.retention_seconds
+        while self._old_files and os.path.getmtime(self._old_files[0]) < cutoff:
+            remove_file(self._old_files.pop(0))
+        with self._lock:
+            expired = [segment for segment in self.closed_segments if segment.end_time < cutoff]
+            self.closed_segments = self.closed_segments[len(expired):]
+        for segment in expired:
+            remove_file(segment.path)
+
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def link_or_copy(source, destination):
+    # رابط صلب لا ينسخ البيانات، ويبقى الملف متاحاً حتى بعد حذف المقطع الأصلي
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+
+def concat_segments(paths, output_path):
+    # دمج بنسخ التدفق (-c copy) دون إعادة ترميز
+    ffmpeg = shutil.which('ffmpeg')
+    if ffmpeg is None:
+        return None
+    list_path = output_path + '.txt'
+    with open(list_path, 'w', encoding='utf-8') as f:
+        for path in paths:
+            f.write(f"file '{os.path.abspath(path)}'\n")
+    try:
+        result = subprocess.run([ffmpeg, '-hide_banner', '-loglevel', 'error', '-y', '-f', 'concat', '-safe', '0',
+                                 '-i', list_path, '-c', 'copy', output_path], capture_output=True)
+    finally:
+        remove_file(list_path)
+    return output_path if result.returncode == 0 else None
+
+
+def export_clip(segments, in_frame, out_frame, fps, directory, name, mode='reference'):
+    # مرجع خفيف: روابط المقاطع مع ملف وصف فيه نقطتا البداية والنهاية، أو ملف واحد بنسخ التدفق
+    if not segments:
+        return None
+    first = segments[0].start_frame
+    manifest = {
+        'fps': fps,
+        'in': max(0, in_frame - first) / fps,
+        'out': (min(out_frame, segments[-1].end_frame) - first) / fps,
+        'start_time': segments[0].start_time,
+        'segments': []
+    }
+
+    video_path = None
+    if mode == 'concat':
+        video_path = concat_segments([segment.path for segment in segments], os.path.join(directory, f"{name}.mp4"))
+    if video_path is not None:
+        manifest['video'] = os.path.basename(video_path)
+    else:
+        clip_dir = os.path.join(directory, name)
+        os.makedirs(clip_dir, exist_ok=True)
+        for segment in segments:
+            if not os.path.exists(segment.path):
+                continue
+            link_or_copy(segment.path, os.path.join(clip_dir, os.path.basename(segment.path)))
+            manifest['segments'].append({'file': os.path.join(name, os.path.basename(segment.path)),
+                                         'start_frame': segment.start_frame - first,
+                                         'frames': segment.end_frame - segment.start_frame})
+
+    manifest_path = os.path.join(directory, f"{name}.json")
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    return video_path or manifest_path
@@ -0,0 +1,47 @@
+import cv2
+import numpy as np
+
+from alert_system import AlertSystem
+
+
+BEHAVIOR = {'type': 'fire', 'severity': 'critical', 'location': (20, 20), 'details': 'test'}
+
+
+def make_frame(i):
+    return np.full((120, 160, 3), i % 256, dtype=np.uint8)
+
+
+def count_frames(path):
+    cap = cv2.VideoCapture(path)
+    count = 0
+    while cap.read()[0]:
+        count += 1
+    cap.release()
+    return count
+
+
+def test_trigger_alert_does_not_copy_pre_roll(tmp_path):
+    alerts = AlertSystem(str(tmp_path), buffer_size=40, post_roll_frames=20, sound=None)
+    for i in range(100):
+        alerts.add_frame_to_buffer(make_frame(i))
+    future = alerts.trigger_alert(BEHAVIOR, make_frame(100))
+    assert not alerts.video_buffer._saved
+    for i in range(100, 120):
+        alerts.add_frame_to_buffer(make_frame(i))
+    result = future.result(timeout=30)
+    alerts.close()
+    assert count_frames(result['video']) == 60
+    assert not alerts.video_buffer._saved
+
+
+def test_overlapping_alerts_write_full_clips(tmp_path):
+    alerts = AlertSystem(str(tmp_path), buffer_size=30, post_roll_frames=60, sound=None)
+    futures = []
+    for i in range(200):
+        alerts.add_frame_to_buffer(make_frame(i))
+        if i in (50, 60, 70):
+            futures.append(alerts.trigger_alert(BEHAVIOR, make_frame(i)))
+    alerts.close()
+    for future in futures:
+        assert count_frames(future.result()['video']) == 90
+    assert not alerts.video_buffer._saved
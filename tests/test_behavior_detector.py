@@ -0,0 +1,35 @@
+import pytest
+
+from behavior_detector import BehaviorDetector
+
+
+def person(track_id, x, y=300):
+    return {'id': track_id, 'center': (x, y), 'bbox': (x - 15, y - 40, x + 15, y + 40), 'class': 0}
+
+
+def run(detector, positions):
+    behaviors = []
+    for frame, (x1, x2) in enumerate(positions):
+        behaviors.extend(detector.detect_behaviors([person(1, x1), person(2, x2)], None, frame / 30))
+    return [b['type'] for b in behaviors]
+
+
+@pytest.mark.parametrize('velocity_span', [1, 3])
+def test_oscillating_pair_raises_fighting(velocity_span):
+    # ±25 بكسل كل إطار حول نقطة ثابتة: 750 بكسل/ثانية على طول المسار، وإزاحة صافية شبه معدومة
+    jitter = [25 if frame % 2 else -25 for frame in range(20)]
+    positions = [(200 + dx, 260 - dx) for dx in jitter]
+    assert 'fighting' in run(BehaviorDetector(velocity_span=velocity_span), positions)
+
+
+def test_still_pair_raises_nothing():
+    assert run(BehaviorDetector(), [(200, 260)] * 20) == []
+
+
+def test_path_speed_matches_speed_on_straight_motion():
+    detector = BehaviorDetector()
+    for frame in range(10):
+        detector.detect_behaviors([person(1, 100 + 10 * frame)], None, frame / 30)
+    features = detector.tracks.features(detector.tracks.lookup([1]), 3)
+    assert features['path_speeds'][0] == pytest.approx(300)
+    assert features['speeds'][0] == pytest.approx(300)
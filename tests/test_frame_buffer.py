@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+
+from frame_buffer import create_frame_buffer
+
+
+def frame(value, shape=(8, 8, 3)):
+    return np.full(shape, value, dtype=np.uint8)
+
+
+def values(buffer, pin):
+    return [int(f[0, 0, 0]) for f in buffer.read(pin)]
+
+
+@pytest.mark.parametrize('mode', ['raw', 'downscale'])
+def test_pin_keeps_frames_that_leave_the_buffer(mode):
+    options = {} if mode == 'raw' else {'scale': 1.0}
+    buffer = create_frame_buffer(mode, 5, **options)
+    for i in range(10):
+        buffer.append(frame(i))
+    pin = buffer.pin(3)
+    for i in range(10, 20):
+        buffer.append(frame(i))
+    buffer.seal(pin)
+    assert len(pin) == 13
+    assert values(buffer, pin) == list(range(7, 20))
+    buffer.release(pin)
+    assert not buffer._saved
+
+
+def test_pin_copies_nothing_until_overwritten():
+    buffer = create_frame_buffer('raw', 5)
+    for i in range(5):
+        buffer.append(frame(i))
+    pin = buffer.pin(5)
+    assert not buffer._saved
+    buffer.append(frame(5))
+    assert list(buffer._saved) == [0]
+    buffer.seal(pin)
+    assert values(buffer, pin) == list(range(6))
+
+
+def test_overlapping_pins_share_saved_frames():
+    buffer = create_frame_buffer('raw', 4)
+    for i in range(4):
+        buffer.append(frame(i))
+    first = buffer.pin(4)
+    second = buffer.pin(2)
+    for i in range(4, 8):
+        buffer.append(frame(i))
+    buffer.seal(first)
+    buffer.seal(second)
+    assert sorted(buffer._saved) == [0, 1, 2, 3]
+    buffer.release(first)
+    assert sorted(buffer._saved) == [2, 3]
+    assert values(buffer, second) == list(range(2, 8))
+    buffer.release(second)
+    assert not buffer._saved
+
+
+def run_pinned(buffer, make, frames=200, pins_at=(30, 40, 50)):
+    peak = 0
+    pins = []
+    for i in range(frames):
+        buffer.append(make(i))
+        if i in pins_at:
+            pins.append(buffer.pin())
+        peak = max(peak, buffer.nbytes + buffer.saved_bytes)
+    for pin in pins:
+        buffer.seal(pin)
+    return peak, pins
+
+
+@pytest.mark.parametrize('mode', ['raw', 'downscale'])
+def test_saved_frames_count_against_budget(mode):
+    rng = np.random.default_rng(0)
+    noise = lambda i: rng.integers(0, 256, (120, 160, 3), dtype=np.uint8)
+    buffer = create_frame_buffer(mode, 150, memory_budget_mb=2, **({} if mode == 'raw' else {'scale': 1.0}))
+    peak, pins = run_pinned(buffer, noise)
+    assert peak <= buffer.memory_budget
+    assert buffer.dropped_frames > 0
+    frames = list(buffer.read(pins[0]))
+    assert 0 < len(frames) < len(pins[0])
+    assert all(f.shape == (120, 160, 3) for f in frames)
+
+
+def test_saved_frames_are_compressed_before_dropped():
+    buffer = create_frame_buffer('raw', 150, memory_budget_mb=2)
+    peak, pins = run_pinned(buffer, lambda i: frame(i, (120, 160, 3)))
+    assert peak <= buffer.memory_budget
+    assert buffer.dropped_frames == 0
+    assert len(list(buffer.read(pins[0]))) == len(pins[0])
+    for pin in pins:
+        buffer.release(pin)
+    assert buffer.saved_bytes == 0
@@ -0,0 +1,23 @@
+from types import SimpleNamespace
+
+import pytest
+
+from detection_cache import DetectionCache, model_name
+from inference_backend import OnnxRuntimeBackend, OnnxYoloBackend, OpenVinoBackend
+
+
+def test_base_backend_is_abstract():
+    with pytest.raises(TypeError):
+        OnnxYoloBackend('models/yolov8n.onnx')
+
+
+def test_cache_key_includes_backend(tmp_path):
+    torch_model = SimpleNamespace(ckpt_path='yolov8n.pt')
+    onnx_model = SimpleNamespace(ckpt_path='models/yolov8n.onnx', backend=OnnxRuntimeBackend.backend)
+    openvino_model = SimpleNamespace(ckpt_path='models/yolov8n.onnx', backend=OpenVinoBackend.backend)
+    names = [model_name(m) for m in (torch_model, onnx_model, openvino_model)]
+    assert names == ['yolov8n_torch', 'yolov8n_onnxruntime', 'yolov8n_openvino']
+
+    video = tmp_path / 'video.avi'
+    video.write_bytes(b'0' * 1024)
+    assert len({DetectionCache.path_for(str(tmp_path), str(video), name) for name in names}) == 3
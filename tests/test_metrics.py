@@ -0,0 +1,23 @@
+import urllib.request
+
+import pytest
+
+from metrics import Metrics, MetricsServer
+
+
+def test_server_requires_a_port():
+    with pytest.raises(TypeError):
+        MetricsServer(Metrics())
+
+
+def test_server_on_os_assigned_port():
+    metrics = Metrics()
+    metrics.inc('frames', stream='cam0')
+    server = MetricsServer(metrics, 0).start()
+    try:
+        host, port = server.address
+        assert port != 0
+        body = urllib.request.urlopen(f'http://{host}:{port}/metrics', timeout=10).read().decode()
+        assert 'moraqab_frames' in body
+    finally:
+        server.stop()
@@ -0,0 +1,84 @@
+import threading
+
+import pytest
+
+from benchmark import StubModel, SyntheticScene
+from moraqab_system import MoraqabSystem
+
+
+class FailingModel(StubModel):
+    def __init__(self, fail_on):
+        super().__init__()
+        self.fail_on = fail_on
+        self.calls = 0
+
+    def __call__(self, source, verbose=False):
+        self.calls += 1
+        if self.calls == self.fail_on:
+            raise RuntimeError("model failed")
+        return super().__call__(source, verbose)
+
+
+def make_system(tmp_path, model):
+    return MoraqabSystem(model=model, warmup=False, store_events=False,
+                         alert_options={'output_dir': str(tmp_path / 'alerts'), 'sound': None})
+
+
+def run_with_timeout(system, source, timeout=60, **options):
+    outcome = {}
+
+    def target():
+        try:
+            system.run(source, **options)
+        except Exception as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "run() did not return"
+    return outcome.get('error')
+
+
+@pytest.fixture
+def video(tmp_path):
+    scene = SyntheticScene(320, 240, persons=4, vehicles=1)
+    return scene.write_video(str(tmp_path / 'scene.avi'), 60)
+
+
+def test_failing_model_raises_from_run(tmp_path, video):
+    system = make_system(tmp_path, FailingModel(fail_on=5))
+    error = run_with_timeout(system, video)
+    assert isinstance(error, RuntimeError)
+    assert not system.running
+
+
+def test_failing_callback_raises_from_run(tmp_path, video):
+    seen = []
+
+    def on_result(packet):
+        seen.append(packet['index'])
+        if len(seen) == 3:
+            raise ValueError("callback failed")
+
+    system = make_system(tmp_path, StubModel())
+    error = run_with_timeout(system, video, on_result=on_result)
+    assert isinstance(error, ValueError)
+
+
+def test_run_completes(tmp_path, video):
+    system = make_system(tmp_path, StubModel())
+    assert run_with_timeout(system, video) is None
+    assert system.pipeline.stats['frames'] == 60
+
+
+def test_events_are_stored_when_run_returns(tmp_path):
+    scene = SyntheticScene(640, 360, persons=20, vehicles=2)
+    video = scene.write_video(str(tmp_path / 'busy.avi'), 120)
+    system = MoraqabSystem(model=StubModel(), warmup=False,
+                           alert_options={'output_dir': str(tmp_path / 'alerts'), 'sound': None})
+    assert run_with_timeout(system, video) is None
+    system.stop()
+    alerts = system.pipeline.stats['alerts']
+    assert alerts > 0
+    assert system.event_store.count(camera='cam0') == alerts
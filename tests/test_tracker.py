@@ -0,0 +1,29 @@
+import pytest
+
+from kalman_tracker import KalmanTracker
+from tracker import ObjectTracker
+
+
+def walker(x, y=200):
+    return {'bbox': (x - 15, y - 40, x + 15, y + 40), 'confidence': 0.9, 'class': 0}
+
+
+@pytest.mark.parametrize('tracker_cls', [ObjectTracker, KalmanTracker])
+@pytest.mark.parametrize('stride', [1, 4])
+def test_fast_walker_keeps_its_id_with_detection_stride(tracker_cls, stride):
+    tracker = tracker_cls()
+    ids = set()
+    for frame in range(40):
+        if frame % stride == 0:
+            objects = tracker.update([walker(50 + 40 * frame)])
+        else:
+            objects = tracker.predict()
+        ids.update(obj['id'] for obj in objects)
+    assert ids == {1}
+
+
+def test_distant_detection_is_not_matched_after_one_frame():
+    tracker = ObjectTracker(max_distance=100)
+    tracker.update([walker(100)])
+    objects = tracker.update([walker(400)])
+    assert sorted(obj['id'] for obj in objects) == [1, 2]
@@ -0,0 +1,22 @@
+import pytest
+
+from behavior_detector import BehaviorDetector
+from zones import Zone
+
+SQUARE = [(0, 0), (100, 0), (100, 100), (0, 100)]
+
+
+def test_unknown_threshold_is_rejected():
+    with pytest.raises(ValueError, match='fighting_speed'):
+        Zone('gate', SQUARE, thresholds={'fighting_speed': 300})
+
+
+def test_known_thresholds_are_accepted():
+    zone = Zone('gate', SQUARE, thresholds={'fight_speed': 300, 'crowd_min_persons': 3})
+    assert zone.thresholds == {'fight_speed': 300, 'crowd_min_persons': 3}
+
+
+def test_thresholds_match_detector_attributes():
+    detector = BehaviorDetector()
+    for name in BehaviorDetector.THRESHOLDS:
+        assert hasattr(detector, name)
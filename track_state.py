@@ -0,0 +1,128 @@
+import numpy as np
+
+
+class TrackStateStore:
+    # نافذة ثابتة لكل مسار (المركز، أبعاد الصندوق، الزمن) في مصفوفات NumPy مشتركة،
+    # والخصائص الحركية تُحسب لكل المسارات دفعة واحدة
+    def __init__(self, history_size=30, capacity=64):
+        self.history_size = history_size
+        self.capacity = capacity
+        self._slots = {}
+        self._free = list(range(capacity - 1, -1, -1))
+
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.positions = np.zeros((capacity, history_size, 2), dtype=np.float32)
+        self.sizes = np.zeros((capacity, history_size, 2), dtype=np.float32)
+        self.times = np.zeros((capacity, history_size), dtype=np.float64)
+        self.lengths = np.zeros(capacity, dtype=np.int32)
+        self.heads = np.zeros(capacity, dtype=np.int32)
+        self.last_seen = np.zeros(capacity, dtype=np.int64)
+
+    def lookup(self, ids):
+        return np.array([self._slots.get(track_id, -1) for track_id in ids], dtype=np.intp)
+
+    def features(self, slots, span=3):
+        # السرعة على آخر span عينة، والسرعة السابقة على الـ span التي قبلها، مقسومة على الزمن الفعلي
+        # (بكسل/ثانية) فلا تتغير العتبات مع معدل الإطارات أو أخذ العينات؛ NaN إذا لم يكفِ التاريخ
+        # path_speeds: طول المسار خطوة بخطوة على نفس النافذة، فالحركة ذهاباً وإياباً (الشجار) لا تُلغي نفسها
+        slots = np.asarray(slots, dtype=np.intp)
+        count = len(slots)
+        known = slots >= 0
+        safe = np.where(known, slots, 0)
+        lengths = np.where(known, self.lengths[safe], 0)
+
+        steps = np.array([1, 1 + span, 1 + 2 * span])
+        order = (self.heads[safe][:, None] - steps) % self.history_size
+        positions = self.positions[safe[:, None], order].astype(np.float64)
+        times = self.times[safe[:, None], order]
+        sizes = self.sizes[safe[:, None], order].astype(np.float64)
+        available = lengths[:, None] >= steps
+
+        path_order = (self.heads[safe][:, None] - np.arange(1, span + 2)) % self.history_size
+        path = self.positions[safe[:, None], path_order].astype(np.float64)
+        path_times = self.times[safe[:, None], path_order]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            elapsed = np.where(available[:, 1:], times[:, :2] - times[:, 1:], np.nan)
+            elapsed[elapsed <= 0] = np.nan
+            velocities = (positions[:, :2] - positions[:, 1:]) / elapsed[:, :, None]
+            speeds = np.linalg.norm(velocities, axis=2)
+            path_elapsed = np.where(lengths >= span + 1, path_times[:, 0] - path_times[:, -1], np.nan)
+            path_elapsed[path_elapsed <= 0] = np.nan
+            path_speeds = np.linalg.norm(path[:, :-1] - path[:, 1:], axis=2).sum(axis=1) / path_elapsed
+            acceleration = (speeds[:, 0] - speeds[:, 1]) / ((elapsed[:, 0] + elapsed[:, 1]) / 2)
+            # نسبة الارتفاع إلى العرض: الشخص الواقف أعلى من عرضه، والساقط أعرض
+            aspects = np.where(available & (sizes[:, :, 0] > 0), sizes[:, :, 1] / sizes[:, :, 0], np.nan)
+
+        return {
+            'velocities': velocities[:, 0].reshape(count, 2),
+            'speeds': speeds[:, 0].reshape(count),
+            'path_speeds': path_speeds.reshape(count),
+            'prev_speeds': speeds[:, 1].reshape(count),
+            'accelerations': acceleration.reshape(count),
+            'aspects': aspects[:, 0].reshape(count),
+            'aspect_changes': (aspects[:, 0] / aspects[:, 2]).reshape(count)
+        }
+
+    def record(self, ids, centers, frame_count, sizes=None, timestamp=None):
+        if len(ids) == 0:
+            return
+        slots = np.array([self._slot_for(track_id) for track_id in ids], dtype=np.intp)
+        heads = self.heads[slots]
+        self.positions[slots, heads] = centers
+        self.sizes[slots, heads] = 0 if sizes is None else sizes
+        self.times[slots, heads] = frame_count if timestamp is None else timestamp
+        self.heads[slots] = (heads + 1) % self.history_size
+        self.lengths[slots] = np.minimum(self.lengths[slots] + 1, self.history_size)
+        self.last_seen[slots] = frame_count
+
+    def history(self, track_id):
+        slot = self._slots.get(track_id)
+        if slot is None:
+            return np.zeros((0, 2), dtype=np.float32)
+        length = self.lengths[slot]
+        order = (self.heads[slot] - length + np.arange(length)) % self.history_size
+        return self.positions[slot, order].copy()
+
+    def evict(self, ids):
+        for track_id in ids:
+            slot = self._slots.pop(track_id, None)
+            if slot is not None:
+                self._free.append(slot)
+
+    def evict_idle(self, frame_count, max_idle_frames):
+        idle = [track_id for track_id, slot in self._slots.items()
+                if frame_count - self.last_seen[slot] > max_idle_frames]
+        self.evict(idle)
+        return idle
+
+    def __contains__(self, track_id):
+        return track_id in self._slots
+
+    def __len__(self):
+        return len(self._slots)
+
+    def _slot_for(self, track_id):
+        slot = self._slots.get(track_id)
+        if slot is not None:
+            return slot
+        if not self._free:
+            self._grow()
+        slot = self._free.pop()
+        self._slots[track_id] = slot
+        self.ids[slot] = track_id
+        self.lengths[slot] = 0
+        self.heads[slot] = 0
+        return slot
+
+    def _grow(self):
+        extra = self.capacity
+        self.ids = np.concatenate([self.ids, np.zeros(extra, dtype=self.ids.dtype)])
+        self.positions = np.concatenate([self.positions, np.zeros((extra, self.history_size, 2), dtype=np.float32)])
+        self.sizes = np.concatenate([self.sizes, np.zeros((extra, self.history_size, 2), dtype=np.float32)])
+        self.times = np.concatenate([self.times, np.zeros((extra, self.history_size), dtype=np.float64)])
+        self.lengths = np.concatenate([self.lengths, np.zeros(extra, dtype=self.lengths.dtype)])
+        self.heads = np.concatenate([self.heads, np.zeros(extra, dtype=self.heads.dtype)])
+        self.last_seen = np.concatenate([self.last_seen, np.zeros(extra, dtype=self.last_seen.dtype)])
+        self._free.extend(range(self.capacity + extra - 1, self.capacity - 1, -1))
+        self.capacity += extra
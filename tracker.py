@@ -1,88 +1,153 @@
 import numpy as np
-from collections import defaultdict
+from scipy.optimize import linear_sum_assignment
 
 
 class ObjectTracker:
-    def __init__(self):
+    def __init__(self, max_disappeared=30, max_distance=100, match_classes=False, capacity=64):
         self.next_id = 1
-        self.tracked_objects = {}
-        self.max_disappeared = 30
-        self.disappeared = defaultdict(int)
+        self.max_disappeared = max_disappeared
+        self.max_distance = max_distance
+        self.match_classes = match_classes
+
+        self.capacity = capacity
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.centers = np.zeros((capacity, 2), dtype=np.int32)
+        self.boxes = np.zeros((capacity, 4), dtype=np.int32)
+        self.classes = np.zeros(capacity, dtype=np.int32)
+        self.disappeared = np.zeros(capacity, dtype=np.int32)
+        self.active = np.zeros(capacity, dtype=bool)
+
+        # سرعة كل مسار (بكسل/إطار) لاستكمال المواقع في الإطارات بلا كشف
+        self.velocities = np.zeros((capacity, 2), dtype=np.float32)
+        self.elapsed = np.zeros(capacity, dtype=np.int32)
+        self.coasted = np.zeros(capacity, dtype=np.int32)
+
+        # معرفات المسارات التي حُذفت في آخر تحديث
+        self.removed_ids = []
 
     def update(self, detections):
+        self.removed_ids = []
+        slots = np.flatnonzero(self.active)
+        self.elapsed[slots] += 1
+
         if len(detections) == 0:
-            for object_id in list(self.disappeared.keys()):
-                self.disappeared[object_id] += 1
-                if self.disappeared[object_id] > self.max_disappeared:
-                    del self.tracked_objects[object_id]
-                    del self.disappeared[object_id]
-            return list(self.tracked_objects.values())
-
-        input_centroids = []
-        input_boxes = []
-        input_classes = []
-
-        for det in detections:
-            x1, y1, x2, y2 = det['bbox']
-            cx = int((x1 + x2) / 2)
-            cy = int((y1 + y2) / 2)
-            input_centroids.append((cx, cy))
-            input_boxes.append(det['bbox'])
-            input_classes.append(det['class'])
-
-        if len(self.tracked_objects) == 0:
-            for i in range(len(input_centroids)):
-                self._register(input_centroids[i], input_boxes[i], input_classes[i])
-        else:
-            object_ids = list(self.tracked_objects.keys())
-            object_centroids = [obj['center'] for obj in self.tracked_objects.values()]
-
-            D = np.zeros((len(object_centroids), len(input_centroids)))
-            for i, oc in enumerate(object_centroids):
-                for j, ic in enumerate(input_centroids):
-                    D[i, j] = np.sqrt((oc[0] - ic[0]) ** 2 + (oc[1] - ic[1]) ** 2)
-
-            rows = D.min(axis=1).argsort()
-            cols = D.argmin(axis=1)[rows]
-
-            used_rows = set()
-            used_cols = set()
-
-            for row, col in zip(rows, cols):
-                if row in used_rows or col in used_cols:
-                    continue
-                if D[row, col] > 100:
-                    continue
-
-                object_id = object_ids[row]
-                self.tracked_objects[object_id]['center'] = input_centroids[col]
-                self.tracked_objects[object_id]['bbox'] = input_boxes[col]
-                self.disappeared[object_id] = 0
-
-                used_rows.add(row)
-                used_cols.add(col)
-
-            unused_rows = set(range(D.shape[0])) - used_rows
-            unused_cols = set(range(D.shape[1])) - used_cols
-
-            for row in unused_rows:
-                object_id = object_ids[row]
-                self.disappeared[object_id] += 1
-                if self.disappeared[object_id] > self.max_disappeared:
-                    del self.tracked_objects[object_id]
-                    del self.disappeared[object_id]
-
-            for col in unused_cols:
-                self._register(input_centroids[col], input_boxes[col], input_classes[col])
-
-        return list(self.tracked_objects.values())
-
-    def _register(self, centroid, bbox, obj_class):
-        self.tracked_objects[self.next_id] = {
-            'id': self.next_id,
-            'center': centroid,
-            'bbox': bbox,
-            'class': obj_class
-        }
-        self.disappeared[self.next_id] = 0
-        self.next_id += 1
+            self.coasted[slots] = 0
+            self._mark_missed(slots)
+            return self.get_objects()
+
+        boxes = np.array([det['bbox'] for det in detections], dtype=np.int32).reshape(-1, 4)
+        classes = np.array([det['class'] for det in detections], dtype=np.int32)
+        centers = (boxes[:, :2] + boxes[:, 2:]) // 2
+
+        matched_slots, matched_cols = self._match(slots, centers, classes)
+
+        moved = centers[matched_cols] - self.centers[matched_slots]
+        self.velocities[matched_slots] = moved / self.elapsed[matched_slots, None]
+        self.centers[matched_slots] = centers[matched_cols]
+        self.boxes[matched_slots] = boxes[matched_cols]
+        self.disappeared[matched_slots] = 0
+        self.elapsed[matched_slots] = 0
+        self.coasted[slots] = 0
+
+        self._mark_missed(np.setdiff1d(slots, matched_slots, assume_unique=True))
+
+        unmatched_cols = np.setdiff1d(np.arange(len(boxes)), matched_cols, assume_unique=True)
+        self._register(centers[unmatched_cols], boxes[unmatched_cols], classes[unmatched_cols])
+
+        return self.get_objects()
+
+    def predict(self):
+        slots = np.flatnonzero(self.active)
+        self.elapsed[slots] += 1
+        self.coasted[slots] += 1
+        return self.get_objects()
+
+    def age(self):
+        # إطار ساكن: الوقت يمضي دون حركة، فلا استكمال للمواقع ولا يُحسب فقداناً
+        self.removed_ids = []
+        slots = np.flatnonzero(self.active)
+        self.elapsed[slots] += 1
+        return self.get_objects()
+
+    def get_objects(self):
+        slots = np.flatnonzero(self.active)
+        offsets = self._offsets(slots)
+        centers = self.centers[slots] + offsets
+        boxes = self.boxes[slots] + np.tile(offsets, 2)
+        return [
+            {'id': object_id, 'center': tuple(center), 'bbox': tuple(bbox), 'class': obj_class}
+            for object_id, center, bbox, obj_class in zip(
+                self.ids[slots].tolist(),
+                centers.tolist(),
+                boxes.tolist(),
+                self.classes[slots].tolist()
+            )
+        ]
+
+    def _offsets(self, slots):
+        return np.rint(self.velocities[slots] * self.coasted[slots, None]).astype(np.int32)
+
+    def _match(self, slots, centers, classes):
+        if len(slots) == 0:
+            return slots, np.zeros(0, dtype=np.intp)
+
+        # التنبؤ بعدد الإطارات منذ آخر مطابقة (بما فيها هذا الإطار)، وهو نفس المقام في حساب السرعة
+        predicted = self.centers[slots] + np.rint(self.velocities[slots] * self.elapsed[slots, None]).astype(np.int32)
+        diff = predicted[:, None, :].astype(np.float32) - centers[None, :, :]
+        cost = np.sqrt(np.einsum('ijk,ijk->ij', diff, diff))
+
+        # max_distance لكل إطار: المسار الذي لم يُطابق منذ عدة إطارات (كشف كل N إطار) يُسمح له بمسافة أكبر
+        limits = self.max_distance * np.maximum(1, self.elapsed[slots, None])
+        gated = cost > limits
+        if self.match_classes:
+            gated |= self.classes[slots, None] != classes[None, :]
+        cost[gated] = limits.max() * 1000 + 1
+
+        rows, cols = linear_sum_assignment(cost)
+        keep = ~gated[rows, cols]
+        return slots[rows[keep]], cols[keep]
+
+    def _mark_missed(self, slots):
+        if len(slots) == 0:
+            return
+        self.disappeared[slots] += 1
+        expired = slots[self.disappeared[slots] > self.max_disappeared]
+        if len(expired):
+            self.removed_ids.extend(self.ids[expired].tolist())
+            self.active[expired] = False
+
+    def _register(self, centers, boxes, classes):
+        count = len(centers)
+        if count == 0:
+            return
+
+        free = np.flatnonzero(~self.active)
+        if len(free) < count:
+            self._grow(self.capacity + count - len(free))
+            free = np.flatnonzero(~self.active)
+        slots = free[:count]
+
+        self.ids[slots] = np.arange(self.next_id, self.next_id + count)
+        self.centers[slots] = centers
+        self.boxes[slots] = boxes
+        self.classes[slots] = classes
+        self.disappeared[slots] = 0
+        self.velocities[slots] = 0
+        self.elapsed[slots] = 0
+        self.coasted[slots] = 0
+        self.active[slots] = True
+        self.next_id += count
+
+    def _grow(self, min_capacity):
+        capacity = max(min_capacity, self.capacity * 2)
+        extra = capacity - self.capacity
+        self.ids = np.concatenate([self.ids, np.zeros(extra, dtype=self.ids.dtype)])
+        self.centers = np.concatenate([self.centers, np.zeros((extra, 2), dtype=self.centers.dtype)])
+        self.boxes = np.concatenate([self.boxes, np.zeros((extra, 4), dtype=self.boxes.dtype)])
+        self.classes = np.concatenate([self.classes, np.zeros(extra, dtype=self.classes.dtype)])
+        self.disappeared = np.concatenate([self.disappeared, np.zeros(extra, dtype=self.disappeared.dtype)])
+        self.active = np.concatenate([self.active, np.zeros(extra, dtype=bool)])
+        self.velocities = np.concatenate([self.velocities, np.zeros((extra, 2), dtype=self.velocities.dtype)])
+        self.elapsed = np.concatenate([self.elapsed, np.zeros(extra, dtype=self.elapsed.dtype)])
+        self.coasted = np.concatenate([self.coasted, np.zeros(extra, dtype=self.coasted.dtype)])
+        self.capacity = capacity
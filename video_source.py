@@ -0,0 +1,203 @@
+import queue
+import threading
+
+import cv2
+
+
+def is_live_source(source):
+    if isinstance(source, int):
+        return True
+    source = str(source)
+    return source.isdigit() or source.startswith(('rtsp://', 'rtmp://', 'http://', 'https://'))
+
+
+class VideoSource:
+    # فك الفيديو في خيط مستقل حتى لا يُضاف زمن الفك إلى زمن الكشف
+    # البث المباشر: الخيط يفرغ مخزن الكاميرا بـ grab() باستمرار، ولا يفك (retrieve) إلا الإطار المطلوب فعلاً
+    # الملفات: قراءة مسبقة لعدد محدود من الإطارات، مع أخذ عينات (sample_fps) وقفز سريع (seek)
+    def __init__(self, source, live=None, max_size=None, sample_fps=None, start=0.0, prefetch=4,
+                 seek_threshold=90):
+        self.source = source
+        self.live = is_live_source(source) if live is None else live
+        self.max_size = max_size
+        self.sample_fps = sample_fps
+        self.start = start
+        self.prefetch = prefetch
+        self.seek_threshold = seek_threshold
+
+        self.fps = 0.0
+        self.frame_count = 0
+        self.stride = 1
+        self.decoded = 0
+        self.skipped = 0
+        self.cap = None
+        self._size = None
+        self._thread = None
+        self._running = False
+        self._frames = queue.Queue(maxsize=max(1, prefetch))
+        self._cond = threading.Condition()
+        self._latest = None
+        self._wanted = False
+        self._seek_to = None
+        self._generation = 0
+        self._returned = -1
+
+    def open(self):
+        source = int(self.source) if str(self.source).isdigit() else self.source
+        self.cap = cv2.VideoCapture(source)
+        if not self.cap.isOpened():
+            self.cap.release()
+            raise IOError(f"Cannot open video source: {self.source}")
+        if self.live:
+            # أقل مخزن ممكن داخل OpenCV للمصادر التي تدعمه
+            self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.frame_count = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT)) if not self.live else 0
+        if self.sample_fps and self.fps > 0:
+            self.stride = max(1, int(round(self.fps / self.sample_fps)))
+        if self.start:
+            self.seek(self.start)
+
+        self._running = True
+        target = self._live_reader if self.live else self._file_reader
+        self._thread = threading.Thread(target=target, name=f"capture-{self.source}", daemon=True)
+        self._thread.start()
+        return self
+
+    def read(self):
+        # (رقم الإطار في المصدر، الإطار)، أو None عند النهاية
+        if not self.live:
+            while True:
+                item = self._frames.get()
+                if item is None:
+                    self._frames.put(None)
+                    return None
+                # إطارات فُكت قبل آخر قفز لا تُعاد
+                generation, index, frame = item
+                if generation == self._generation:
+                    return index, frame
+
+        with self._cond:
+            self._wanted = True
+            while self._running and (self._latest is None or self._latest[0] <= self._returned):
+                self._cond.wait()
+            item = self._latest
+            self._latest = None
+            self._wanted = False
+            if item is None:
+                return None
+            self._returned = item[0]
+            return item
+
+    def seek(self, seconds):
+        self.seek_frame(int(round(seconds * self.fps)))
+
+    def seek_frame(self, index):
+        # يمكن استدعاؤها قبل open() للبدء من إطار معين
+        if self.live:
+            return
+        with self._cond:
+            self._generation += 1
+            self._seek_to = index
+        self._drain()
+
+    def release(self):
+        self._running = False
+        with self._cond:
+            self._cond.notify_all()
+        self._drain()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.cap is not None:
+            self.cap.release()
+
+    def _resize(self, frame):
+        if not self.max_size:
+            return frame
+        if self._size is None:
+            height, width = frame.shape[:2]
+            scale = min(1.0, self.max_size / max(height, width))
+            self._size = (int(round(width * scale)), int(round(height * scale)))
+        if self._size == (frame.shape[1], frame.shape[0]):
+            return frame
+        return cv2.resize(frame, self._size, interpolation=cv2.INTER_AREA)
+
+    def _drain(self):
+        try:
+            while True:
+                self._frames.get_nowait()
+        except queue.Empty:
+            pass
+
+    def _live_reader(self):
+        index = -1
+        try:
+            while self._running:
+                if not self.cap.grab():
+                    break
+                index += 1
+                with self._cond:
+                    # لا أحد ينتظر إطاراً: نتركه دون فك، والإطار التالي سيكون أحدث منه
+                    if not self._wanted:
+                        self.skipped += 1
+                        continue
+                    ret, frame = self.cap.retrieve()
+                    if not ret:
+                        break
+                    self.decoded += 1
+                    self._latest = (index, self._resize(frame))
+                    self._cond.notify_all()
+        finally:
+            with self._cond:
+                self._running = False
+                self._cond.notify_all()
+
+    def _file_reader(self):
+        position = 0
+        wanted = 0
+        try:
+            while self._running:
+                with self._cond:
+                    seek_to, self._seek_to = self._seek_to, None
+                    generation = self._generation
+                if seek_to is not None:
+                    self.cap.set(cv2.CAP_PROP_POS_FRAMES, seek_to)
+                    position = wanted = seek_to
+
+                # الإطارات بين العينات تُتخطى بـ grab() دون فك، أو بقفز مباشر إذا كانت الفجوة كبيرة
+                gap = wanted - position
+                if gap >= self.seek_threshold:
+                    self.cap.set(cv2.CAP_PROP_POS_FRAMES, wanted)
+                    self.skipped += gap
+                    position = wanted
+                while position < wanted:
+                    if not self.cap.grab():
+                        return
+                    self.skipped += 1
+                    position += 1
+
+                ret, frame = self.cap.read()
+                if not ret:
+                    return
+                self.decoded += 1
+                item = (generation, position, self._resize(frame))
+                position += 1
+                wanted = position - 1 + self.stride
+                while self._running:
+                    try:
+                        self._frames.put(item, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+        finally:
+            self._put_end()
+
+    def _put_end(self):
+        while True:
+            try:
+                self._frames.put(None, timeout=0.1)
+                return
+            except queue.Full:
+                if not self._running:
+                    self._drain()
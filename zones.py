@@ -0,0 +1,150 @@
+import json
+
+import cv2
+import numpy as np
+
+RULES = ('fighting', 'fire', 'fall', 'crowd')
+# عتبات BehaviorDetector التي يمكن تجاوزها داخل منطقة
+THRESHOLDS = ('fight_distance', 'fight_speed', 'vehicle_distance', 'fall_speed_before', 'fall_speed_after',
+              'fall_aspect_change', 'crowd_radius', 'crowd_min_persons', 'crowd_min_neighbors')
+
+
+class Zone:
+    def __init__(self, name, polygon, rules=None, thresholds=None):
+        self.name = name
+        self.polygon = np.asarray(polygon, dtype=np.float64).reshape(-1, 2)
+        if len(self.polygon) < 3:
+            raise ValueError(f"Zone {name} needs at least 3 points")
+        # None تعني كل القواعد، والعتبات تتجاوز قيم BehaviorDetector الافتراضية داخل المنطقة فقط
+        self.rules = set(RULES if rules is None else rules)
+        unknown = self.rules - set(RULES)
+        if unknown:
+            raise ValueError(f"Unknown rules for zone {name}: {sorted(unknown)}")
+        self.thresholds = dict(thresholds or {})
+        unknown = set(self.thresholds) - set(THRESHOLDS)
+        if unknown:
+            raise ValueError(f"Unknown thresholds for zone {name}: {sorted(unknown)}")
+
+    @property
+    def bounds(self):
+        x1, y1 = np.floor(self.polygon.min(axis=0)).astype(int)
+        x2, y2 = np.ceil(self.polygon.max(axis=0)).astype(int)
+        return x1, y1, x2, y2
+
+    def contains(self, points):
+        # قاعدة الزوجي/الفردي لكل النقاط دفعة واحدة
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        x, y = points[:, :1], points[:, 1:]
+        x1, y1 = self.polygon[:, 0], self.polygon[:, 1]
+        x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+        spans = (y1 > y) != (y2 > y)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cross_x = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+        return ((spans & (x < cross_x)).sum(axis=1) % 2) == 1
+
+
+class ZoneLayout:
+    def __init__(self, zones, padding=32, max_crop_ratio=0.6, tile_size=None, tile_overlap=64,
+                 nms_threshold=0.5):
+        self.zones = list(zones)
+        self.padding = padding
+        self.max_crop_ratio = max_crop_ratio
+        self.tile_size = tile_size
+        self.tile_overlap = tile_overlap
+        self.nms_threshold = nms_threshold
+        self._regions = {}
+
+    def regions(self, shape):
+        # المستطيلات المحيطة بالمناطق تُحسب مرة واحدة لكل مقاس إطار
+        height, width = shape[:2]
+        key = (height, width)
+        if key not in self._regions:
+            self._regions[key] = self._compute_regions(width, height)
+        return self._regions[key]
+
+    def crops(self, frame):
+        return [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in self.regions(frame.shape)]
+
+    def merge(self, region_detections, shape):
+        # إعادة الكشف إلى إحداثيات الإطار، ثم حذف المكرر بين المربعات المتداخلة وما خارج المناطق
+        detections = []
+        for (x1, y1, _, _), dets in zip(self.regions(shape), region_detections):
+            for det in dets:
+                bx1, by1, bx2, by2 = det['bbox']
+                detections.append(dict(det, bbox=(bx1 + x1, by1 + y1, bx2 + x1, by2 + y1)))
+        if not detections:
+            return detections
+
+        if len(self.regions(shape)) > 1:
+            boxes = [[x1, y1, x2 - x1, y2 - y1] for x1, y1, x2, y2 in (d['bbox'] for d in detections)]
+            keep = cv2.dnn.NMSBoxesBatched(boxes, [d['confidence'] for d in detections],
+                                           [d['class'] for d in detections], 0.0, self.nms_threshold)
+            detections = [detections[i] for i in sorted(np.asarray(keep, dtype=int).reshape(-1).tolist())]
+
+        boxes = np.array([d['bbox'] for d in detections], dtype=np.float64)
+        centers = (boxes[:, :2] + boxes[:, 2:]) / 2
+        inside = self.locate(centers) >= 0
+        return [det for det, keep in zip(detections, inside) if keep]
+
+    def locate(self, points):
+        # رقم أول منطقة تحتوي كل نقطة، أو -1
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        result = np.full(len(points), -1)
+        for i, zone in reversed(list(enumerate(self.zones))):
+            result[zone.contains(points)] = i
+        return result
+
+    def _compute_regions(self, width, height):
+        rects = []
+        for zone in self.zones:
+            x1, y1, x2, y2 = zone.bounds
+            rects.append([max(0, x1 - self.padding), max(0, y1 - self.padding),
+                          min(width, x2 + self.padding), min(height, y2 + self.padding)])
+        rects = self._merge_overlapping([r for r in rects if r[2] > r[0] and r[3] > r[1]])
+
+        # إذا غطت المناطق معظم الإطار فلا فائدة من القص
+        area = sum((x2 - x1) * (y2 - y1) for x1, y1, x2, y2 in rects)
+        if not rects or area >= self.max_crop_ratio * width * height:
+            rects = [[0, 0, width, height]]
+
+        if self.tile_size:
+            rects = [tile for rect in rects for tile in self._tile(rect)]
+        return [tuple(int(v) for v in rect) for rect in rects]
+
+    @staticmethod
+    def _merge_overlapping(rects):
+        merged = True
+        while merged:
+            merged = False
+            for i in range(len(rects)):
+                for j in range(i + 1, len(rects)):
+                    a, b = rects[i], rects[j]
+                    if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                        rects[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                        del rects[j]
+                        merged = True
+                        break
+                if merged:
+                    break
+        return rects
+
+    def _tile(self, rect):
+        # مربعات متداخلة بدقة المصدر حتى لا تصغر الأجسام البعيدة عند تحجيم الصورة للنموذج
+        x1, y1, x2, y2 = rect
+        step = max(1, self.tile_size - self.tile_overlap)
+
+        def starts(lo, hi):
+            if hi - lo <= self.tile_size:
+                return [lo]
+            count = int(np.ceil((hi - lo - self.tile_overlap) / step))
+            return np.linspace(lo, hi - self.tile_size, count).round().astype(int).tolist()
+
+        return [[x, y, min(x + self.tile_size, x2), min(y + self.tile_size, y2)]
+                for y in starts(y1, y2) for x in starts(x1, x2)]
+
+
+def load_zones(path):
+    # ملف JSON: {"cam0": [{"name": ..., "polygon": [[x, y], ...], "rules": [...], "thresholds": {...}}]}
+    with open(path, encoding='utf-8') as f:
+        config = json.load(f)
+    return {camera: [Zone(**zone) for zone in zones] for camera, zones in config.items()}